@@ -3,23 +3,37 @@ import os
 import sys
 import argparse
 import tkinter as tk
-import cv2
+from PIL import ImageTk
+
+from contact_sheet import run_contact_sheet
+from file_ops import FileOps, JOURNAL_NAME, undo_into
+from image_discovery import find_images
+from thumbnail_cache import ThumbnailCache, DEFAULT_CACHE, GALLERY_SIZE
 
 # parse user arguments
 parser = argparse.ArgumentParser(description='Sort images into two directories')
 parser.add_argument('input_dir', help='input directory')
 parser.add_argument('output_dir', help='output directory')
 parser.add_argument('-r', '--recursive', action='store_true', help='recursively search input directory')
+parser.add_argument('--cache', default=DEFAULT_CACHE, help='thumbnail cache file, fill it ahead with thumbnail_cache.py')
+parser.add_argument('--grid', action='store_true', help='sort in a grid of thumbnails with multi-select')
+parser.add_argument('--journal', help='undo journal of saves and deletes (default: in the output directory)')
 args = parser.parse_args()
+journal = args.journal or os.path.join(args.output_dir, JOURNAL_NAME)
+thumbnail_cache = ThumbnailCache(args.cache)
 
 # create a list of all the images in the input directory
-image_list = []
-for root, dirs, files in os.walk(args.input_dir):
-    for file in files:
-        if file.endswith('.jpg') or file.endswith('.png'):
-            image_list.append(os.path.join(root, file))
+image_list = find_images(args.input_dir, args.recursive, extensions=('.jpg', '.png'))
+
+# sort in a grid of thumbnails instead of one image at a time
+if args.grid:
+    run_contact_sheet(image_list, args.output_dir, 'move', title='Image Sorter', cache_path=args.cache, journal=journal)
+    sys.exit()
+
+# queue saves and deletes on a background thread
+file_ops = FileOps(journal)
 
-# create a graphical window using tkinter and cv2
+# create a graphical window using tkinter
 window = tk.Tk()
 window.title('Image Sorter')
 window.geometry('800x600')
@@ -31,7 +45,10 @@ image_label.pack()
 
 def show_image():
     global image_index
-    image_label.config(image=tk.PhotoImage(file=image_list[image_index]))
+    # tk.PhotoImage cannot read JPEGs, use a window-sized thumbnail from the cache instead
+    photo = ImageTk.PhotoImage(thumbnail_cache.thumbnail(image_list[image_index], GALLERY_SIZE))
+    image_label.config(image=photo)
+    image_label.image = photo
 
 def next_image():
     global image_index
@@ -50,17 +67,21 @@ def prev_image():
 # add a button to save the current image to the output directory and display the next image
 def save_image():
     global image_index
-    os.rename(image_list[image_index], os.path.join(args.output_dir, os.path.basename(image_list[image_index])))
+    file_ops.move(image_list[image_index], args.output_dir)
     del image_list[image_index]
     next_image()
 
 # add a button to delete the current image and display the next image
 def delete_image():
     global image_index
-    os.remove(image_list[image_index])
+    file_ops.delete(image_list[image_index])
     del image_list[image_index]
     next_image()
 
+# undo the last save or delete, putting the image back in the slideshow
+def undo():
+    undo_into(window, file_ops, image_list, lambda entry: image_index, lambda entry: show_image())
+
 # create buttons
 prev_button = tk.Button(window, text='Previous', command=prev_image)
 prev_button.pack(side='left')
@@ -70,9 +91,15 @@ delete_button = tk.Button(window, text='Delete', command=delete_image)
 delete_button.pack(side='left')
 next_button = tk.Button(window, text='Next', command=next_image)
 next_button.pack(side='left')
+undo_button = tk.Button(window, text='Undo', command=undo)
+undo_button.pack(side='left')
+window.bind('<Control-z>', lambda event: undo())
 
 # display the first image
 show_image()
 
 # start the GUI
 window.mainloop()
+
+# finish queued saves and deletes before exiting
+file_ops.flush()
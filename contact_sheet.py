@@ -0,0 +1,303 @@
+"""
+Virtualized contact-sheet grid for culling large folders of images.
+
+The sheet is laid out as one tall scrollable canvas, but only the rows that are
+on screen exist: a fixed pool of canvas items is moved to wherever the view is
+and given the thumbnails of the cells it now shows. Thumbnails are decoded by
+a background thread pool and Tk PhotoImages are only kept for visible cells,
+so memory stays the same for ten images or ten thousand.
+
+Controls:
+    click               select one image
+    ctrl-click          add or remove an image from the selection
+    shift-click         select a range
+    ctrl-a              select all
+    s                   save the selected images
+    d / delete          delete the selected images
+    ctrl-z              undo the last save or delete
+    q / escape          quit
+
+Saves and deletes run in the background through file_ops, which journals them.
+
+Usage:
+    python contact_sheet.py photos/ keepers/
+"""
+
+import argparse
+import os
+import queue
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import ImageTk
+
+from file_ops import FileOps, JOURNAL_NAME, undo_into
+from image_discovery import find_images
+from image_preview import open_preview
+from thumbnail_cache import ThumbnailCache, SHEET_SIZE
+
+THUMB_SIZE = SHEET_SIZE
+CELL_WIDTH, CELL_HEIGHT = 170, 190
+
+class ContactSheet:
+    """Grid of thumbnails in a Tk window.
+
+    Saving copies or moves (save_mode) the selected images into output_dir and
+    deleting moves them to the trash, both queued on file_ops. Moved and deleted
+    images leave the grid and come back when undone.
+    """
+
+    def __init__(self, root, paths, output_dir, save_mode="copy", file_ops=None, cache_path=None, workers=4):
+        self.root = root
+        self.paths = list(paths)
+        self.output_dir = output_dir
+        self.save_mode = save_mode
+        self.file_ops = file_ops or FileOps()
+        self.cache_path = cache_path
+        # where images that left the grid were, to put them back on undo
+        self.removed_at = {}
+        self.selected = set()
+        self.anchor = None
+        self.columns = 1
+
+        # canvas items reused for whatever cells are on screen
+        self.cells = []
+        # PhotoImages of the visible cells only, by path
+        self.photos = {}
+
+        # background decoding; workers skip paths that scrolled out of view
+        self.lock = threading.Lock()
+        self.wanted = set()
+        self.requested = set()
+        self.failed = set()
+        self.loaded = queue.Queue()
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        self.status = tk.Label(root, anchor=tk.W)
+        self.status.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas = tk.Canvas(root, bg="gray20", highlightthickness=0, yscrollincrement=CELL_HEIGHT // 4)
+        self.scrollbar = tk.Scrollbar(root, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.scrolled)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", self.resize)
+        self.canvas.bind("<Button-1>", lambda event: self.click(event, "single"))
+        self.canvas.bind("<Control-Button-1>", lambda event: self.click(event, "toggle"))
+        self.canvas.bind("<Shift-Button-1>", lambda event: self.click(event, "range"))
+        self.canvas.bind("<MouseWheel>", lambda event: self.wheel(1 if event.delta > 0 else -1))
+        self.canvas.bind("<Button-4>", lambda event: self.wheel(1))
+        self.canvas.bind("<Button-5>", lambda event: self.wheel(-1))
+        root.bind("<Control-a>", lambda event: self.select_all())
+        root.bind("s", lambda event: self.save_selected())
+        root.bind("d", lambda event: self.delete_selected())
+        root.bind("<Delete>", lambda event: self.delete_selected())
+        root.bind("<Control-z>", lambda event: self.undo())
+        root.bind("q", lambda event: self.close())
+        root.bind("<Escape>", lambda event: self.close())
+        root.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.update_status()
+        self.root.after(30, self.poll)
+
+    def scrolled(self, first, last):
+        self.scrollbar.set(first, last)
+        self.layout()
+
+    # one wheel notch scrolls a full row
+    def wheel(self, direction):
+        self.canvas.yview_scroll(-4 * direction, "units")
+
+    def resize(self, event):
+        self.columns = max(1, event.width // CELL_WIDTH)
+        self.update_scrollregion()
+        self.layout()
+
+    def update_scrollregion(self):
+        rows = -(-len(self.paths) // self.columns)
+        self.canvas.configure(scrollregion=(0, 0, self.columns * CELL_WIDTH, max(rows * CELL_HEIGHT, 1)))
+
+    # move the item pool over the cells in view and ask for missing thumbnails
+    def layout(self):
+        first_row = int(self.canvas.canvasy(0) // CELL_HEIGHT)
+        rows = self.canvas.winfo_height() // CELL_HEIGHT + 2
+        start = first_row * self.columns
+        stop = min(len(self.paths), start + rows * self.columns)
+
+        while len(self.cells) < rows * self.columns:
+            self.cells.append((self.canvas.create_rectangle(0, 0, 0, 0, width=3, state=tk.HIDDEN),
+                               self.canvas.create_image(0, 0, state=tk.HIDDEN),
+                               self.canvas.create_text(0, 0, fill="white", width=CELL_WIDTH - 10, state=tk.HIDDEN)))
+
+        visible = self.paths[start:stop]
+        for slot, (rect, image, text) in enumerate(self.cells):
+            index = start + slot
+            if index >= stop:
+                for item in (rect, image, text):
+                    self.canvas.itemconfigure(item, state=tk.HIDDEN)
+                continue
+            path = self.paths[index]
+            x = (index % self.columns) * CELL_WIDTH
+            y = (index // self.columns) * CELL_HEIGHT
+            self.canvas.coords(rect, x + 3, y + 3, x + CELL_WIDTH - 3, y + CELL_HEIGHT - 3)
+            self.canvas.itemconfigure(rect, state=tk.NORMAL, outline="orange" if path in self.selected else "gray30")
+            self.canvas.coords(image, x + CELL_WIDTH // 2, y + 10 + THUMB_SIZE[1] // 2)
+            self.canvas.itemconfigure(image, state=tk.NORMAL, image=self.photos.get(path, ""))
+            self.canvas.coords(text, x + CELL_WIDTH // 2, y + CELL_HEIGHT - 18)
+            self.canvas.itemconfigure(text, state=tk.NORMAL, text=os.path.basename(path))
+
+        # drop the PhotoImages of cells that scrolled away
+        visible_set = set(visible)
+        for path in list(self.photos):
+            if path not in visible_set:
+                del self.photos[path]
+        with self.lock:
+            self.wanted = visible_set
+        for path in visible:
+            if path not in self.photos and path not in self.requested and path not in self.failed:
+                self.requested.add(path)
+                self.pool.submit(self._load, path)
+
+    # worker: decode one thumbnail unless it is no longer on screen
+    def _load(self, path):
+        with self.lock:
+            if path not in self.wanted:
+                self.loaded.put((path, None, False))
+                return
+        try:
+            if self.cache_path:
+                # sqlite connections cannot be shared between threads
+                if not hasattr(self.local, "cache"):
+                    self.local.cache = ThumbnailCache(self.cache_path)
+                image = self.local.cache.thumbnail(path, THUMB_SIZE)
+            else:
+                image = open_preview(path, THUMB_SIZE)
+            self.loaded.put((path, image, False))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            self.loaded.put((path, None, True))
+
+    # PhotoImages can only be made on the Tk thread, so finished thumbnails
+    # are collected here
+    def poll(self):
+        changed = False
+        try:
+            while True:
+                path, image, failed = self.loaded.get_nowait()
+                self.requested.discard(path)
+                if failed:
+                    self.failed.add(path)
+                elif image is not None and path in self.wanted:
+                    self.photos[path] = ImageTk.PhotoImage(image)
+                    changed = True
+        except queue.Empty:
+            pass
+        if changed:
+            self.layout()
+        self.root.after(30, self.poll)
+
+    def index_at(self, event):
+        col = int(self.canvas.canvasx(event.x) // CELL_WIDTH)
+        row = int(self.canvas.canvasy(event.y) // CELL_HEIGHT)
+        index = row * self.columns + col
+        if col >= self.columns or index >= len(self.paths):
+            return None
+        return index
+
+    def click(self, event, mode):
+        index = self.index_at(event)
+        if index is None:
+            return
+        path = self.paths[index]
+        if mode == "toggle":
+            self.selected ^= {path}
+            self.anchor = index
+        elif mode == "range" and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected.update(self.paths[low:high + 1])
+        else:
+            self.selected = {path}
+            self.anchor = index
+        self.layout()
+        self.update_status()
+
+    def select_all(self):
+        self.selected = set(self.paths)
+        self.layout()
+        self.update_status()
+
+    def apply(self, action):
+        if not self.selected:
+            return
+        remaining = []
+        for index, path in enumerate(self.paths):
+            if path not in self.selected:
+                remaining.append(path)
+                continue
+            if action == "delete":
+                self.file_ops.delete(path)
+            elif self.save_mode == "move":
+                self.file_ops.move(path, self.output_dir)
+            else:
+                self.file_ops.copy(path, self.output_dir)
+                remaining.append(path)
+                continue
+            # moved and deleted images leave the grid
+            self.removed_at[os.path.abspath(path)] = index
+        # in place, so an undo under way puts images back into the current list
+        self.paths[:] = remaining
+        self.selected = set()
+        self.anchor = None
+        self.update_scrollregion()
+        self.layout()
+        self.update_status()
+
+    def save_selected(self):
+        self.apply("save")
+
+    def delete_selected(self):
+        self.apply("delete")
+
+    def undo(self):
+        undo_into(self.root, self.file_ops, self.paths, lambda entry: self.removed_at.pop(entry["src"], None), self.restore)
+
+    def restore(self, entry):
+        # it may have failed to load while it was gone
+        self.failed.discard(entry["src"])
+        self.update_scrollregion()
+        self.layout()
+        self.update_status()
+
+    def update_status(self):
+        self.status.config(text=f"{len(self.paths)} images, {len(self.selected)} selected"
+                                "    click / ctrl-click / shift-click: select    s: save    d: delete    ctrl-z: undo    q: quit")
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+# open a contact sheet in its own window and run it until closed; queued file
+# operations are finished before returning
+def run_contact_sheet(paths, output_dir, save_mode="copy", title="Contact Sheet", cache_path=None, journal=None):
+    file_ops = FileOps(journal or os.path.join(output_dir, JOURNAL_NAME))
+    root = tk.Tk()
+    root.title(title)
+    root.geometry("1024x768")
+    ContactSheet(root, paths, output_dir, save_mode, file_ops, cache_path)
+    root.mainloop()
+    file_ops.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cull images in a scrollable grid of thumbnails")
+    parser.add_argument("search_dir", help="directory to search for images")
+    parser.add_argument("output_dir", help="directory selected images are copied to with s")
+    parser.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--move", action="store_true", help="move saved images instead of copying them")
+    parser.add_argument("--cache", help="thumbnail cache file to read and fill")
+    parser.add_argument("--journal", help=f"undo journal (default: {JOURNAL_NAME} in output_dir)")
+    args = parser.parse_args()
+
+    run_contact_sheet(find_images(args.search_dir, not args.no_recursive), args.output_dir,
+                      "move" if args.move else "copy", cache_path=args.cache, journal=args.journal)
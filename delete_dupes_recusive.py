@@ -1,6 +1,50 @@
 import os
 import sys
+import time
 import hashlib
+import random
+import shutil
+import sqlite3
+import argparse
+import functools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# only needed for --perceptual
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = Image = None
+
+# read files in 1 MiB chunks instead of all at once
+CHUNK_SIZE = 1 << 20
+
+# the partial hash reads this much from the start and from the end of a file
+EDGE_SIZE = 64 << 10
+
+# hashing threads per kind of storage: spinning disks thrash with many readers,
+# network shares need many requests in flight to hide latency
+STORAGE_WORKERS = {"hdd": 2, "ssd": 8, "network": 32}
+
+HASH_ALGORITHMS = ["md5", "sha1", "blake2b"] + (["xxh3"] if xxhash is not None else [])
+
+PERCEPTUAL_HASHES = ["dhash", "phash"]
+
+LINK_METHODS = ["auto", "hardlink", "reflink"]
+
+# Linux ioctl that makes a file share the extents of another (btrfs, xfs, ...)
+FICLONE = 0x40049409
 
 def find_images(directory):
     """Recursively find all image files in a directory."""
@@ -12,20 +56,647 @@ def find_images(directory):
                 images.append(os.path.join(root, file))
     return images
 
-def delete_duplicates(dir1, dir2, test_mode):
-    """Find and delete duplicate images in dir2."""
-    dir1_images = set([hashlib.md5(open(img, 'rb').read()).hexdigest() for img in find_images(dir1)])
-    dir2_images = find_images(dir2)
-    for img in dir2_images:
-        md5_hash = hashlib.md5(open(img, 'rb').read()).hexdigest()
-        if md5_hash in dir1_images:
+def _new_hash(algorithm):
+    if algorithm == "xxh3":
+        if xxhash is None:
+            raise Exception("Error: xxh3 needs the xxhash package")
+        return xxhash.xxh3_128
+    return algorithm
+
+def hash_file(path, algorithm="md5"):
+    """Hash a file in chunks without reading it into memory.
+
+    Returns (digest, bytes read).
+    """
+    digest = _new_hash(algorithm)
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, "file_digest"):
+            h = hashlib.file_digest(f, digest)
+        else:
+            h = digest() if callable(digest) else hashlib.new(digest)
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+        return h.hexdigest(), f.tell()
+
+def partial_hash_file(path, algorithm="md5"):
+    """Hash only the first and last EDGE_SIZE bytes of a file.
+
+    Returns (digest, bytes read). Files up to 2 * EDGE_SIZE are read whole, so
+    for them the partial hash is a full hash.
+    """
+    digest = _new_hash(algorithm)
+    h = digest() if callable(digest) else hashlib.new(digest)
+    with open(path, 'rb') as f:
+        head = f.read(EDGE_SIZE)
+        h.update(head)
+        read = len(head)
+        if len(head) == EDGE_SIZE:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(max(EDGE_SIZE, size - EDGE_SIZE))
+            tail = f.read(EDGE_SIZE)
+            h.update(tail)
+            read += len(tail)
+    return h.hexdigest(), read
+
+class HashStats:
+    """Counts files and bytes hashed to report throughput."""
+
+    def __init__(self, label="Hashed"):
+        self.label = label
+        self.files = 0
+        self.bytes = 0
+        self.cached = 0
+        self.seconds = 0.0
+
+    def report(self):
+        seconds = max(self.seconds, 1e-9)
+        cached = f", {self.cached} more from the index" if self.cached else ""
+        print(f"{self.label} {self.files} files ({self.bytes / 1e6:.1f} MB) in {self.seconds:.2f} s: "
+              f"{self.files / seconds:.1f} files/s, {self.bytes / 1e6 / seconds:.1f} MB/s{cached}")
+
+class HashIndex:
+    """On-disk SQLite index of digests, so unchanged files are not hashed again.
+
+    An entry is only trusted while the file's size, mtime_ns and inode are the
+    same as when it was hashed.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS hashes (
+            path TEXT, kind TEXT, algorithm TEXT,
+            size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT,
+            PRIMARY KEY (path, kind, algorithm))""")
+
+    def lookup(self, path, st, kind, algorithm):
+        row = self.db.execute("SELECT size, mtime_ns, inode, digest FROM hashes "
+                              "WHERE path = ? AND kind = ? AND algorithm = ?",
+                              (os.path.abspath(path), kind, algorithm)).fetchone()
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+        return None
+
+    def store(self, entries, kind, algorithm):
+        """Store (path, stat, digest) entries."""
+        self.db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [(os.path.abspath(path), kind, algorithm, st.st_size, st.st_mtime_ns, st.st_ino, digest)
+                             for path, st, digest in entries])
+        self.db.commit()
+
+    def forget(self, paths):
+        self.db.executemany("DELETE FROM hashes WHERE path = ?", [(os.path.abspath(p),) for p in paths])
+        self.db.commit()
+
+    def prune(self, roots, existing):
+        """Drop entries under roots for files that are no longer there. Returns how many."""
+        roots = [os.path.join(os.path.abspath(r), "") for r in roots]
+        existing = {os.path.abspath(p) for p in existing}
+        stale = [path for (path,) in self.db.execute("SELECT DISTINCT path FROM hashes")
+                 if path.startswith(tuple(roots)) and path not in existing]
+        self.forget(stale)
+        return len(stale)
+
+    def close(self):
+        self.db.close()
+
+def hash_files(paths, algorithm="md5", workers=STORAGE_WORKERS["ssd"], stats=None, hasher=hash_file,
+               index=None, file_stats=None):
+    """Hash files on a thread pool. Returns {path: digest}, skipping unreadable files.
+
+    With an index (and the os.stat results of the files) digests of unchanged
+    files are taken from the index and new ones are stored in it.
+    """
+    def work(path):
+        try:
+            return (path,) + hasher(path, algorithm)
+        except OSError as e:
+            print(f"Skipping {path}: {e}")
+            return path, None, 0
+
+    start = time.perf_counter()
+    digests = {}
+    kind = "full" if hasher is hash_file else "partial"
+    if index is not None:
+        if file_stats is None:
+            file_stats = stat_files(paths)
+        for path in paths:
+            if path in file_stats:
+                digest = index.lookup(path, file_stats[path], kind, algorithm)
+                if digest is not None:
+                    digests[path] = digest
+        if stats is not None:
+            stats.cached += len(digests)
+        paths = [p for p in paths if p not in digests]
+
+    hashed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, digest, read in pool.map(work, paths):
+            if digest is None:
+                continue
+            digests[path] = digest
+            hashed.append(path)
+            if stats is not None:
+                stats.files += 1
+                stats.bytes += read
+    if index is not None:
+        index.store([(p, file_stats[p], digests[p]) for p in hashed if p in file_stats], kind, algorithm)
+    if stats is not None:
+        stats.seconds += time.perf_counter() - start
+    return digests
+
+def stat_files(paths):
+    """Returns {path: os.stat result}, skipping files that cannot be stat'ed."""
+    stats = {}
+    for path in paths:
+        try:
+            stats[path] = os.stat(path)
+        except OSError as e:
+            print(f"Skipping {path}: {e}")
+    return stats
+
+def file_sizes(paths):
+    return {path: st.st_size for path, st in stat_files(paths).items()}
+
+def _matching(keys1, keys2):
+    """Keep only the entries of each {path: key} dict whose key occurs in the other."""
+    common = set(keys1.values()) & set(keys2.values())
+    return ({p: k for p, k in keys1.items() if k in common},
+            {p: k for p, k in keys2.items() if k in common})
+
+def find_duplicates(dir1_files, dir2_files, algorithm="md5", workers=STORAGE_WORKERS["ssd"], index=None):
+    """Find the files of dir2_files that are byte-identical to one of dir1_files.
+
+    Works in stages so most files are never read in full:
+      1. group by size, a file without a same-size partner cannot be a duplicate
+      2. hash the first and last EDGE_SIZE bytes of files that share a size
+      3. hash in full only the files whose partial hashes still match
+
+    With a HashIndex, files hashed by an earlier run are not read again.
+
+    Returns (sorted duplicate paths, list of per-stage HashStats, total bytes
+    of the files as they were before anything was deleted).
+    """
+    size_stats = HashStats("Stage 1 (size):")
+    partial_stats = HashStats("Stage 2 (partial hash):")
+    full_stats = HashStats("Stage 3 (full hash):")
+    start = time.perf_counter()
+    file_stats = stat_files(dir1_files + dir2_files)
+    sizes1, sizes2 = _matching({p: file_stats[p].st_size for p in dir1_files if p in file_stats},
+                               {p: file_stats[p].st_size for p in dir2_files if p in file_stats})
+    size_stats.files = len(dir1_files) + len(dir2_files)
+    size_stats.seconds = time.perf_counter() - start
+
+    def keyed(sizes, stats, hasher):
+        digests = hash_files(list(sizes), algorithm, workers, stats, hasher, index, file_stats)
+        return {p: (sizes[p], d) for p, d in digests.items()}
+
+    partial1, partial2 = _matching(keyed(sizes1, partial_stats, partial_hash_file),
+                                   keyed(sizes2, partial_stats, partial_hash_file))
+
+    # partial hashes of small files already cover the whole file
+    small2 = {p: k for p, k in partial2.items() if k[0] <= 2 * EDGE_SIZE}
+    large1 = {p: k[0] for p, k in partial1.items() if k[0] > 2 * EDGE_SIZE}
+    large2 = {p: k[0] for p, k in partial2.items() if k[0] > 2 * EDGE_SIZE}
+    _, full2 = _matching(keyed(large1, full_stats, hash_file), keyed(large2, full_stats, hash_file))
+
+    duplicates = sorted(set(small2) | set(full2))
+    total_bytes = sum(st.st_size for st in file_stats.values())
+    return duplicates, [size_stats, partial_stats, full_stats], total_bytes
+
+# total_bytes is what hashing every file in full would have read
+def report_stages(stages, total_bytes):
+    for stats in stages:
+        stats.report()
+    read = sum(stats.bytes for stats in stages)
+    if read <= total_bytes:
+        saving = f"{1 - read / max(total_bytes, 1):.1%} avoided"
+    else:
+        # partial hashes of files that then had to be read in full anyway
+        saving = f"{read / total_bytes - 1:.1%} more than a full read"
+    print(f"Read {read / 1e6:.1f} MB instead of {total_bytes / 1e6:.1f} MB ({saving})")
+
+def delete_duplicates(dir1, dir2, test_mode, algorithm="md5", workers=STORAGE_WORKERS["ssd"], index_path=None):
+    """Find and delete duplicate images in dir2.
+
+    index_path names a SQLite hash index that is reused and updated across runs.
+    """
+    dir1_files, dir2_files = find_images(dir1), find_images(dir2)
+    index = HashIndex(index_path) if index_path else None
+    try:
+        if index is not None:
+            pruned = index.prune([dir1, dir2], dir1_files + dir2_files)
+            if pruned:
+                print(f"Pruned {pruned} deleted files from the index")
+        duplicates, stages, total_bytes = find_duplicates(dir1_files, dir2_files, algorithm, workers, index)
+        for img in duplicates:
             if test_mode:
                 print(f"Found duplicate: {img}")
             else:
                 os.remove(img)
+        if index is not None and not test_mode:
+            index.forget(duplicates)
+    finally:
+        if index is not None:
+            index.close()
+    report_stages(stages, total_bytes)
+
+def _repeated(keys):
+    """Keep only the entries of a {path: key} dict whose key occurs more than once."""
+    counts = {}
+    for key in keys.values():
+        counts[key] = counts.get(key, 0) + 1
+    return {p: k for p, k in keys.items() if counts[k] > 1}
+
+def find_duplicate_clusters(files, algorithm="md5", workers=STORAGE_WORKERS["ssd"], index=None):
+    """Group byte-identical files within one set of files.
+
+    Uses the same size, partial hash and full hash stages as find_duplicates.
+    Paths that are already hardlinks of each other are hashed once, and files on
+    different devices are never put in one cluster since they cannot be linked.
+    Returns (list of clusters, each a list of paths of distinct inodes,
+    {path: os.stat result}, list of per-stage HashStats).
+    """
+    size_stats = HashStats("Stage 1 (size):")
+    partial_stats = HashStats("Stage 2 (partial hash):")
+    full_stats = HashStats("Stage 3 (full hash):")
+    start = time.perf_counter()
+    file_stats = stat_files(files)
+    inodes = {}
+    for path in files:
+        if path in file_stats:
+            inodes.setdefault((file_stats[path].st_dev, file_stats[path].st_ino), path)
+    sizes = _repeated({p: (file_stats[p].st_dev, file_stats[p].st_size) for p in inodes.values()})
+    size_stats.files = len(files)
+    size_stats.seconds = time.perf_counter() - start
+
+    def keyed(keys, stats, hasher):
+        digests = hash_files(list(keys), algorithm, workers, stats, hasher, index, file_stats)
+        return {p: (keys[p], d) for p, d in digests.items()}
+
+    partial = _repeated(keyed(sizes, partial_stats, partial_hash_file))
+    small = {p: k for p, k in partial.items() if k[0][1] <= 2 * EDGE_SIZE}
+    large = {p: k[0] for p, k in partial.items() if k[0][1] > 2 * EDGE_SIZE}
+    full = _repeated(keyed(large, full_stats, hash_file))
+
+    clusters = {}
+    for path, key in list(small.items()) + list(full.items()):
+        clusters.setdefault(key, []).append(path)
+    return list(clusters.values()), file_stats, [size_stats, partial_stats, full_stats]
+
+def _reflink(source, target):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def link_file(source, target, method="auto"):
+    """Atomically replace target with a hardlink or reflink to source.
+
+    The link is made under a temporary name next to target and renamed over it,
+    so target is never missing or half-written. auto tries a reflink first and
+    falls back to a hardlink. Returns the method that was used.
+    """
+    directory, name = os.path.split(target)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.dedupe-tmp")
+    used = method
+    try:
+        if method in ("auto", "reflink"):
+            try:
+                _reflink(source, tmp)
+                used = "reflink"
+                # a reflink is a new file, keep the metadata of the one it replaces
+                shutil.copystat(target, tmp)
+            except OSError:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                if method == "reflink":
+                    raise
+        if used != "reflink":
+            os.link(source, tmp)
+            used = "hardlink"
+        os.replace(tmp, target)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return used
+
+def link_duplicates(dir1, dir2=None, method="auto", dry_run=True, algorithm="md5",
+                    workers=STORAGE_WORKERS["ssd"], index_path=None):
+    """Replace redundant copies within dir1 (and dir2) with links to one copy.
+
+    Paths stay valid for other tools, only the space of the extra copies is
+    freed. Files of dir1 are preferred as the copy that is kept.
+    """
+    dir1_files = find_images(dir1)
+    files = dir1_files + (find_images(dir2) if dir2 else [])
+    reference = set(dir1_files) if dir2 else set()
+    index = HashIndex(index_path) if index_path else None
+    try:
+        clusters, file_stats, stages = find_duplicate_clusters(files, algorithm, workers, index)
+    finally:
+        if index is not None:
+            index.close()
+
+    # every path of every inode, so existing hardlinks of a copy are relinked too
+    names = {}
+    for path, st in file_stats.items():
+        names.setdefault((st.st_dev, st.st_ino), []).append(path)
+
+    reclaimed = linked = 0
+    used = {}
+    for cluster in sorted(clusters):
+        keeper = min(cluster, key=lambda p: (p not in reference, p))
+        print(f"Keep {keeper}")
+        for copy in sorted(cluster):
+            if copy == keeper:
+                continue
+            st = file_stats[copy]
+            paths = sorted(names[(st.st_dev, st.st_ino)])
+            # space only comes back once no name outside the scanned trees holds the inode
+            if st.st_nlink <= len(paths):
+                reclaimed += st.st_size
+            for path in paths:
+                if dry_run:
+                    print(f"  would link {path}")
+                    continue
+                try:
+                    kind = link_file(keeper, path, method)
+                except OSError as e:
+                    print(f"  skipping {path}: {e}")
+                    continue
+                used[kind] = used.get(kind, 0) + 1
+                print(f"  {kind} {path}")
+                linked += 1
+            if dry_run:
+                linked += len(paths)
+    report_stages(stages, sum(st.st_size for st in file_stats.values()))
+    summary = ", ".join(f"{n} {kind}s" for kind, n in sorted(used.items()))
+    action = "Would link" if dry_run else "Linked"
+    print(f"{action} {linked} files in {len(clusters)} clusters{f' ({summary})' if summary else ''}, "
+          f"reclaiming {reclaimed / 1e6:.1f} MB")
+
+def load_gray(path, size):
+    """Decode an image as a (h, w) float array of grayscale values at size (w, h).
+
+    draft() lets the JPEG decoder scale down by up to 8x while decoding, which is
+    most of the work for large photos. Returns (pixels, original (w, h)).
+    """
+    with Image.open(path) as im:
+        resolution = im.size
+        im.draft("L", (size[0] * 4, size[1] * 4))
+        im = im.convert("L").resize(size, Image.BILINEAR)
+        return np.asarray(im, dtype=np.float32), resolution
+
+def dhash(path):
+    """64-bit difference hash: is each pixel brighter than its right neighbour."""
+    pixels, resolution = load_gray(path, (9, 8))
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big"), resolution
+
+@functools.lru_cache(maxsize=None)
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[np.newaxis, :] + 1) * k[:, np.newaxis] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+def phash(path):
+    """64-bit perceptual hash: low DCT frequencies above or below their median."""
+    pixels, resolution = load_gray(path, (32, 32))
+    dct = _dct_matrix(32)
+    low = (dct @ pixels @ dct.T)[:8, :8].ravel()
+    # the DC term only tracks overall brightness
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big"), resolution
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Metric tree over hamming distance, so a search within a small threshold
+    only visits the branches whose distance can still be in range."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = (value, [item], {})
+                return
+            node = node[2][distance]
+
+    def search(self, value, threshold):
+        """Returns the items within threshold of value."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= threshold:
+                found.extend(node[1])
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return found
+
+def perceptual_hashes(paths, method="dhash", workers=STORAGE_WORKERS["ssd"]):
+    """Returns {path: (hash, (w, h), file size)}, skipping files that are not readable images."""
+    hasher = {"dhash": dhash, "phash": phash}[method]
+
+    def work(path):
+        try:
+            value, resolution = hasher(path)
+            return path, (value, resolution, os.stat(path).st_size)
+        # any error of one file (decompression bomb, truncated data, ...) only skips it
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            return path, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return {path: info for path, info in pool.map(work, paths) if info is not None}
+
+def find_similar(dir1_files, dir2_files, method="dhash", threshold=6, workers=STORAGE_WORKERS["ssd"]):
+    """Cluster images of dir2_files with near-duplicates in dir1_files.
+
+    Images within threshold bits of each other are joined into a cluster, which
+    only groups the report: a dir2 image is a duplicate when a dir1 image lies
+    within threshold of it itself, not through a chain of other images. The
+    best dir1 image of a cluster (most pixels, then largest file) is the keeper.
+    A duplicate with more pixels or a larger file than every dir1 image it
+    matches is better than its copies in dir1, and is listed apart.
+    Returns a list of (keeper, [dir2 duplicates], [dir2 duplicates better than
+    their dir1 matches], [other dir1 files], [dir2 files matching no dir1 file]).
+    """
+    if Image is None or np is None:
+        raise Exception("Error: perceptual mode needs Pillow and NumPy")
+    hashes = perceptual_hashes(dir1_files + dir2_files, method, workers)
+    paths = list(hashes)
+    tree = BKTree()
+    for i, path in enumerate(paths):
+        tree.add(hashes[path][0], i)
+
+    # union-find over every pair of images within the threshold
+    parent = list(range(len(paths)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, path in enumerate(paths):
+        for j in tree.search(hashes[path][0], threshold):
+            parent[find(i)] = find(j)
+
+    clusters = {}
+    for i, path in enumerate(paths):
+        clusters.setdefault(find(i), []).append(path)
+
+    def quality(p):
+        (w, h), size = hashes[p][1], hashes[p][2]
+        return w * h, size
+
+    reference = set(dir1_files)
+    results = []
+    for members in clusters.values():
+        if len(members) < 2 or not any(p in reference for p in members) or all(p in reference for p in members):
+            continue
+        keeper = max((p for p in members if p in reference), key=quality)
+        duplicates, better, unmatched = [], [], []
+        for p in sorted(p for p in members if p not in reference):
+            matches = [paths[j] for j in tree.search(hashes[p][0], threshold) if paths[j] in reference]
+            if not matches:
+                unmatched.append(p)
+                continue
+            duplicates.append(p)
+            if quality(p) > max(quality(m) for m in matches):
+                better.append(p)
+        kept = sorted(p for p in members if p != keeper and p in reference)
+        results.append((keeper, duplicates, better, kept, unmatched))
+    return sorted(results)
+
+def delete_similar(dir1, dir2, test_mode, method="dhash", threshold=6, workers=STORAGE_WORKERS["ssd"], delete_better=False):
+    """Find and delete near-duplicate images in dir2 of images in dir1. Copies
+    better than their dir1 matches are kept unless delete_better is set."""
+    start = time.perf_counter()
+    dir1_files, dir2_files = find_images(dir1), find_images(dir2)
+    clusters = find_similar(dir1_files, dir2_files, method, threshold, workers)
+    deleted = spared = 0
+    for keeper, duplicates, better, kept, unmatched in clusters:
+        print(f"Keep {keeper}")
+        for img in kept:
+            print(f"  also keep (in {dir1}) {img}")
+        for img in unmatched:
+            print(f"  keep (no match in {dir1}) {img}")
+        for img in duplicates:
+            if img in better and not delete_better:
+                print(f"  keep better copy {img}")
+                spared += 1
+                continue
+            if test_mode:
+                print(f"  found duplicate {img}")
+            else:
+                os.remove(img)
+            deleted += 1
+    action = "Found" if test_mode else "Deleted"
+    print(f"{action} {deleted} near-duplicates in {len(clusters)} clusters of "
+          f"{len(dir1_files) + len(dir2_files)} images in {time.perf_counter() - start:.2f} s")
+    if spared:
+        print(f"Kept {spared} copies in {dir2} with more pixels or a larger file than their match in {dir1} "
+              f"(--delete-better deletes them too)")
+
+def make_synthetic_tree(root, files=400, seed=0):
+    """Build dir1/dir2 image trees with exact copies and several kinds of near misses."""
+    rng = random.Random(seed)
+    dir1, dir2 = os.path.join(root, "dir1"), os.path.join(root, "dir2")
+    os.makedirs(dir1)
+    os.makedirs(dir2)
+    expected = []
+    for i in range(files):
+        size = rng.choice([rng.randint(1 << 10, 100 << 10), rng.randint(200 << 10, 4 << 20)])
+        data = rng.randbytes(size)
+        with open(os.path.join(dir1, f"img_{i}.jpg"), "wb") as f:
+            f.write(data)
+        kind = i % 5
+        if kind == 0:
+            # exact copy
+            copy = data
+            expected.append(os.path.join(dir2, f"img_{i}.jpg"))
+        elif kind == 1:
+            # same size, different content
+            copy = rng.randbytes(size)
+        elif kind == 2:
+            # same size, same head and tail, one byte changed in the middle
+            middle = size // 2
+            copy = data[:middle] + bytes([data[middle] ^ 1]) + data[middle + 1:]
+        else:
+            # unrelated file with its own size
+            copy = rng.randbytes(size + 1 + rng.randint(0, 1000))
+        with open(os.path.join(dir2, f"img_{i}.jpg"), "wb") as f:
+            f.write(copy)
+    return dir1, dir2, sorted(expected)
+
+def benchmark(files=400, algorithm="md5", workers=STORAGE_WORKERS["ssd"]):
+    """Compare bytes read by the staged pipeline with hashing everything in full."""
+    with tempfile.TemporaryDirectory() as root:
+        dir1, dir2, expected = make_synthetic_tree(root, files)
+        dir1_files, dir2_files = find_images(dir1), find_images(dir2)
+        total_bytes = sum(file_sizes(dir1_files + dir2_files).values())
+
+        naive = HashStats("Full hash of every file:")
+        hashes1 = set(hash_files(dir1_files, algorithm, workers, naive).values())
+        hashes2 = hash_files(dir2_files, algorithm, workers, naive)
+        naive_duplicates = sorted(p for p, d in hashes2.items() if d in hashes1)
+        naive.report()
+
+        duplicates, stages, _ = find_duplicates(dir1_files, dir2_files, algorithm, workers)
+        report_stages(stages, total_bytes)
+        print(f"Duplicates: {len(duplicates)} staged, {len(naive_duplicates)} naive, {len(expected)} expected"
+              f" ({'match' if duplicates == naive_duplicates == expected else 'MISMATCH'})")
 
 if __name__ == "__main__":
-    dir1 = sys.argv[1]
-    dir2 = sys.argv[2]
-    test_mode = sys.argv[3].lower() == "true"
-    delete_duplicates(dir1, dir2, test_mode)
+    parser = argparse.ArgumentParser(description="Delete images in dir2 that are exact copies of images in dir1")
+    parser.add_argument("dir1", nargs="?", help="reference directory, or the tree to dedupe with --link")
+    parser.add_argument("dir2", nargs="?", help="directory to delete duplicates from, optional with --link")
+    parser.add_argument("test_mode", nargs="?", default="true", help="'true' only lists duplicates, 'false' deletes them (default: true)")
+    parser.add_argument("--hash", choices=HASH_ALGORITHMS, default="md5", help="hash algorithm (default: md5, blake2b and xxh3 are faster)")
+    parser.add_argument("--storage", choices=sorted(STORAGE_WORKERS), default="ssd", help="size the hashing thread pool for this storage (default: ssd)")
+    parser.add_argument("--workers", type=int, help="number of hashing threads, overrides --storage")
+    parser.add_argument("--index", metavar="DB", help="SQLite hash index reused across runs, so only new or changed files are hashed")
+    parser.add_argument("--perceptual", choices=PERCEPTUAL_HASHES, help="also match re-encoded and resized copies with this perceptual hash")
+    parser.add_argument("--threshold", type=int, default=6, help="most differing bits of 64 for --perceptual matches (default: 6)")
+    parser.add_argument("--delete-better", action="store_true", help="with --perceptual, also delete copies with more pixels or a larger file than their dir1 match")
+    parser.add_argument("--link", choices=LINK_METHODS, help="replace duplicates within the tree(s) with links instead of deleting (auto: reflink where supported, else hardlink)")
+    parser.add_argument("--dry-run", action="store_true", help="with --link, only report what would be linked and the space reclaimed (the default)")
+    parser.add_argument("--apply", action="store_true", help="with --link, really replace the copies (as does test_mode 'false')")
+    parser.add_argument("--benchmark", action="store_true", help="compare bytes read against full hashing on a synthetic tree")
+    args = parser.parse_args()
+
+    test_mode = args.test_mode.lower() == "true"
+    workers = args.workers or STORAGE_WORKERS[args.storage]
+    try:
+        if args.benchmark:
+            benchmark(algorithm=args.hash, workers=workers)
+        elif args.dir1 and args.link:
+            # like every other mode, only report unless told otherwise
+            dry_run = args.dry_run or not (args.apply or args.test_mode.lower() == "false")
+            link_duplicates(args.dir1, args.dir2, args.link, dry_run, args.hash, workers, args.index)
+        elif args.dir1 and args.dir2 and args.perceptual:
+            delete_similar(args.dir1, args.dir2, test_mode, args.perceptual, args.threshold, workers, args.delete_better)
+        elif args.dir1 and args.dir2:
+            delete_duplicates(args.dir1, args.dir2, test_mode, args.hash, workers, args.index)
+        else:
+            parser.error("dir1 and dir2 are required")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
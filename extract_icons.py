@@ -1,60 +1,257 @@
+"""
+Cut the icons out of sprite sheets.
+
+The icons are found and cut out by segmentation.py: sheets keep their alpha
+channel, each icon is an 8-connected component of the alpha or Otsu mask
+(specks smaller than --min-area are dropped, parts nested inside another
+icon's box belong to it) and comes out as a transparent PNG, scaled once to fit
+icon_size with its aspect kept.
+
+Given a single sheet, the icons are written to output_dir as icon_0.png,
+icon_1.png, ... Given a directory or a glob pattern, every sheet is handled on
+a process pool: each worker decodes its sheet once and hands the icons to a
+writer thread through a bounded queue, so PNG encoding overlaps with cutting out
+the next icons. Each sheet's icons go to a folder named after it, and a JSON
+manifest lists the source sheet, bounding box and output path of every icon.
+
+With --atlas the icons are not written one file each but packed into a few
+power-of-two texture atlases with a JSON sidecar of their UVs (see
+texture_atlas.py), and the manifest names each icon's sprite in the atlas.
+
+Usage:
+    python extract_icons.py sheet.png icons/ 64
+    python extract_icons.py sheets/ icons/ 64 --workers 8
+    python extract_icons.py "sheets/**/*_ui.png" icons/ 64
+    python extract_icons.py sheets/ icons/ 64 --atlas ui --atlas-size 2048
+"""
+
 import cv2
-import numpy as np
+import glob
+import json
 import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_icons(input_image, output_dir, icon_size, padding):
-    # Load the input image
-    image = cv2.imread(input_image)
-    if image is None:
-        raise Exception("Error: input image not found")
+from image_discovery import find_images
+from segmentation import cut_out, find_objects, foreground_mask, load_image
+from texture_atlas import build_atlas
 
-    # Convert the image to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+STAGES = ("decode", "threshold", "components", "resize", "encode")
 
-    # Threshold the image to create a binary image
-    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+# write an icon, timing the encode
+def write_icon(output_path, icon, timings=None):
+    start = time.perf_counter()
+    if not cv2.imwrite(output_path, icon):
+        raise Exception(f"Error: could not write {output_path}")
+    if timings is not None:
+        timings["encode"] += time.perf_counter() - start
 
-    # Find contours in the binary image
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if len(contours) == 0:
-        raise Exception("Error: no objects found in the input image")
+def extract_icons(input_image, output_dir, icon_size, padding, timings=None, write=None, min_area=16, keep_nested=False):
+    """Cut the icons out of one sheet into output_dir. write(output_path, icon)
+    saves each icon (default: write_icon), timings collects seconds per stage.
+    Returns a manifest record per icon."""
+    timings = timings if timings is not None else dict.fromkeys(STAGES, 0.0)
 
-    # Iterate over the contours and extract each icon
-    for i, c in enumerate(contours):
-        # Get the bounding rectangle of the contour
-        x, y, w, h = cv2.boundingRect(c)
+    # Load the input image, alpha included
+    start = time.perf_counter()
+    image = load_image(input_image)
+    timings["decode"] += time.perf_counter() - start
 
-        # Extract the icon from the image
-        icon = image[y:y + h, x:x + w]
+    # Mask the foreground by alpha, or by Otsu threshold without one
+    start = time.perf_counter()
+    mask = foreground_mask(image)
+    timings["threshold"] += time.perf_counter() - start
 
-        # Add padding to the icon
-        icon = cv2.copyMakeBorder(icon, padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=[0, 0, 0, 0])
+    # Find the icons as connected components of the mask
+    start = time.perf_counter()
+    labels, objects = find_objects(mask, min_area, keep_nested)
+    if len(objects) == 0:
+        raise Exception("Error: no objects found in the input image")
+    timings["components"] += time.perf_counter() - start
 
-        # Resize the icon to fit within the desired size
-        icon = cv2.resize(icon, (icon_size, icon_size), interpolation=cv2.INTER_CUBIC)
+    if write is None:
+        os.makedirs(output_dir, exist_ok=True)
+        write = lambda output_path, icon: write_icon(output_path, icon, timings)
 
-        # Turn black pixels to transparency
-        #alpha_channel = np.zeros((icon_size, icon_size), dtype=np.uint8)
-        #alpha_channel[np.where((icon == [0, 0, 0]).all(axis=1))] = 255
-        #icon = cv2.merge((icon, alpha_channel))
+    # Cut out each icon, transparent around it and scaled to fit the desired size
+    records = []
+    for i, obj in enumerate(objects):
+        start = time.perf_counter()
+        x, y, w, h, _ = obj
+        icon = cut_out(image, labels, obj, icon_size, padding)
+        timings["resize"] += time.perf_counter() - start
 
         # Save the icon as a separate image
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
         output_path = os.path.join(output_dir, f"icon_{i}.png")
-        cv2.imwrite(output_path, icon)
+        write(output_path, icon)
+        records.append({"sheet": input_image, "bbox": [x, y, w, h], "output": output_path})
+    return records
+
+# writes icons on a background thread; put blocks once max_pending icons are
+# waiting, so a slow disk holds back the cutting instead of filling memory
+class IconWriter:
+    def __init__(self, max_pending=64):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.failed = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            output_path, icon = self.queue.get()
+            try:
+                write_icon(output_path, icon, self.timings)
+            except Exception as e:
+                self.failed.append((output_path, str(e)))
+            finally:
+                self.queue.task_done()
+
+    def put(self, output_path, icon):
+        self.queue.put((output_path, icon))
+
+    def join(self):
+        """Wait for the queued icons; returns (encode seconds, failed writes)
+        since the last join."""
+        self.queue.join()
+        seconds, failed = self.timings["encode"], self.failed
+        self.timings["encode"], self.failed = 0.0, []
+        return seconds, failed
+
+# one writer per worker process, started with its first sheet
+_writer = None
+
+# worker: extract one sheet, returning (records, timings, error, icons); the
+# icons are only returned instead of written when they go into an atlas
+def _extract_sheet(sheet, output_dir, icon_size, padding, max_pending, atlas=False, min_area=16, keep_nested=False):
+    timings = dict.fromkeys(STAGES, 0.0)
+    if atlas:
+        icons = []
+        try:
+            records = extract_icons(sheet, output_dir, icon_size, padding, timings, lambda path, icon: icons.append(icon),
+                                    min_area, keep_nested)
+            return records, timings, None, icons
+        except Exception as e:
+            return [], timings, str(e), []
+
+    global _writer
+    if _writer is None:
+        _writer = IconWriter(max_pending)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        records = extract_icons(sheet, output_dir, icon_size, padding, timings, _writer.put, min_area, keep_nested)
+        error = None
+    except Exception as e:
+        records, error = [], str(e)
+    seconds, failed = _writer.join()
+    timings["encode"] += seconds
+    if failed:
+        failed_paths = {path for path, _ in failed}
+        records = [r for r in records if r["output"] not in failed_paths]
+        error = "; ".join(message for _, message in failed)
+    return records, timings, error, None
+
+# the sheets named by a file, a directory (searched recursively) or a glob pattern
+def find_sheets(pattern):
+    if os.path.isdir(pattern):
+        return find_images(pattern)
+    if os.path.isfile(pattern):
+        return [pattern]
+    return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+
+def extract_batch(pattern, output_dir, icon_size, padding, workers=None, max_pending=64, manifest_path=None,
+                  atlas=None, atlas_size=4096, atlas_spacing=1, min_area=16, keep_nested=False):
+    """Extract the icons of every sheet matching pattern on a process pool and
+    write a JSON manifest of them (default: manifest.json in output_dir). With
+    atlas, a name, the icons are packed into atlas_0.png, atlas_1.png, ... and
+    atlas.json in output_dir instead of written one by one."""
+    sheets = find_sheets(pattern)
+    if not sheets:
+        raise Exception(f"Error: no sheets found for {pattern}")
+    # each sheet's icons go to a folder named after its path below the common root
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(s)) for s in sheets])
+    manifest_path = manifest_path or os.path.join(output_dir, "manifest.json")
+    workers = workers or os.cpu_count()
+    max_in_flight = workers * 4
+
+    manifest = []
+    sprites = []
+    totals = dict.fromkeys(STAGES, 0.0)
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_sheet = 0
+        while next_sheet < len(sheets) or pending:
+            while next_sheet < len(sheets) and len(pending) < max_in_flight:
+                sheet = sheets[next_sheet]
+                sheet_dir = os.path.join(output_dir, os.path.splitext(os.path.relpath(os.path.abspath(sheet), root))[0])
+                pending.append((sheet, pool.submit(_extract_sheet, sheet, sheet_dir, icon_size, padding, max_pending,
+                                                    bool(atlas), min_area, keep_nested)))
+                next_sheet += 1
+            sheet, future = pending.popleft()
+            records, timings, error, icons = future.result()
+            if atlas:
+                # the sprite is named after the file the icon would have had
+                for record, icon in zip(records, icons):
+                    name = os.path.splitext(os.path.relpath(record.pop("output"), output_dir))[0].replace(os.sep, "/")
+                    record.update(atlas=f"{atlas}.json", sprite=name)
+                    sprites.append((name, icon))
+            manifest.extend(records)
+            for stage in STAGES:
+                totals[stage] += timings[stage]
+            if error:
+                failed += 1
+                print(f"Skipping {sheet}: {error}")
+    if atlas and sprites:
+        # packing and writing the atlas counts as encoding
+        encode_start = time.perf_counter()
+        sidecar = build_atlas(sprites, os.path.join(output_dir, atlas), atlas_size, atlas_spacing)
+        totals["encode"] += time.perf_counter() - encode_start
+        sizes = ", ".join(f"{s['width']}x{s['height']}" for s in sidecar["sheets"])
+        print(f"Packed into {len(sidecar['sheets'])} atlas sheets ({sizes})")
+    seconds = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    print(f"{len(manifest)} icons from {len(sheets) - failed} sheets in {seconds:.1f} s "
+          f"({len(sheets) / max(seconds, 1e-9):.1f} sheets/s), {failed} failed")
+    busy = sum(totals.values())
+    for stage in STAGES:
+        print(f"  {stage:10} {totals[stage]:8.2f} s  {100 * totals[stage] / max(busy, 1e-9):5.1f}%")
+    print(f"Manifest written to {manifest_path}")
+    return manifest
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_image", help="path to the input image")
+    parser.add_argument("input_image", help="path to the input image, or a directory or glob pattern of sheets")
     parser.add_argument("output_dir", help="path to the output directory")
     parser.add_argument("icon_size", type=int, help="desired size of the output icons")
     parser.add_argument("--padding", type=int, default=0, help="amount of padding to add around the icons")
+    parser.add_argument("--min-area", type=int, default=16, help="ignore specks with fewer pixels than this (default: 16)")
+    parser.add_argument("--keep-nested", action="store_true", help="cut out parts nested inside another icon as icons of their own")
+    parser.add_argument("--workers", type=int, default=None, help="processes for a batch of sheets (default: all cores)")
+    parser.add_argument("--max-pending", type=int, default=64, help="icons each worker may have waiting to be written")
+    parser.add_argument("--manifest", help="JSON manifest of a batch (default: manifest.json in output_dir)")
+    parser.add_argument("--atlas", help="pack the icons into texture atlases of this name in output_dir instead of one file each")
+    parser.add_argument("--atlas-size", type=int, default=4096, help="largest atlas side, a power of two (default: 4096)")
+    parser.add_argument("--atlas-spacing", type=int, default=1, help="empty pixels between icons in the atlas (default: 1)")
     args = parser.parse_args()
 
     try:
-        extract_icons(args.input_image, args.output_dir, args.icon_size, args.padding)
+        if os.path.isfile(args.input_image) and not args.atlas:
+            extract_icons(args.input_image, args.output_dir, args.icon_size, args.padding,
+                          min_area=args.min_area, keep_nested=args.keep_nested)
+        else:
+            extract_batch(args.input_image, args.output_dir, args.icon_size, args.padding,
+                          args.workers, args.max_pending, args.manifest,
+                          args.atlas, args.atlas_size, args.atlas_spacing, args.min_area, args.keep_nested)
     except Exception as e:
         print(f"Error: {str(e)}")
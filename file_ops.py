@@ -0,0 +1,281 @@
+"""
+Background file operations with an undo journal, shared by the sorters.
+
+Saving or deleting an image on a network share can take seconds, so the sorters
+queue copies, moves and deletes here and carry on; a single worker thread
+carries them out in order. Copies use shutil.copyfile, which lets the OS copy
+in-kernel (sendfile / copy_file_range), and moves are a plain os.rename when
+source and destination are on the same device. Deletes move the file into a
+.trash folder next to it, so they can be undone too; the space is only freed
+once the trash is emptied with --empty-trash, after which those deletes can no
+longer be undone.
+
+Every operation is appended to a JSONL journal, first when it is queued and
+again when it is done or undone. An interrupted session can then be finished
+(--replay) or reverted (--rollback) from the journal alone. Undo in a sorter
+only reaches back to the start of its own session; older operations are
+reverted with --rollback.
+
+Usage:
+    python file_ops.py saved/.sort-journal.jsonl --list
+    python file_ops.py saved/.sort-journal.jsonl --replay
+    python file_ops.py saved/.sort-journal.jsonl --rollback
+    python file_ops.py saved/.sort-journal.jsonl --empty-trash
+"""
+
+import argparse
+import errno
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+
+TRASH_DIR = ".trash"
+JOURNAL_NAME = ".sort-journal.jsonl"
+
+# path, or path with " (n)" before the extension if it is taken
+def unique_path(path):
+    if not os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(f"{stem} ({n}){ext}"):
+        n += 1
+    return f"{stem} ({n}){ext}"
+
+# rename, falling back to copy and remove across devices
+def move_file(src, dst):
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copyfile(src, dst)
+        shutil.copystat(src, dst)
+        os.remove(src)
+
+# the entries of a journal with their latest state, oldest first
+def load_journal(journal_path):
+    entries = {}
+    if journal_path and os.path.exists(journal_path):
+        with open(journal_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a crash
+                    continue
+                entries.setdefault(record["id"], {}).update(record)
+    return [entries[k] for k in sorted(entries)]
+
+class FileOps:
+    def __init__(self, journal_path=None):
+        self.journal_path = journal_path
+        self.entries = load_journal(journal_path)
+        # undo stops at the operations of earlier sessions
+        self.session_start = len(self.entries)
+        self.next_id = max((e["id"] for e in self.entries), default=0) + 1
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _log(self, record):
+        if not self.journal_path:
+            return
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _submit(self, op, src, target_dir):
+        with self.lock:
+            entry = {"id": self.next_id, "op": op, "src": os.path.abspath(src),
+                     "target_dir": os.path.abspath(target_dir), "dst": None,
+                     "state": "pending", "time": time.time()}
+            self.next_id += 1
+            self.entries.append(entry)
+        self._log(entry)
+        self.queue.put(("do", entry, None))
+        return entry
+
+    def copy(self, src, output_dir):
+        return self._submit("copy", src, output_dir)
+
+    def move(self, src, output_dir):
+        return self._submit("move", src, output_dir)
+
+    def delete(self, path):
+        return self._submit("delete", path, os.path.join(os.path.dirname(path), TRASH_DIR))
+
+    def undo(self):
+        """Queue the reversal of the newest operation of this session not undone
+        yet. Returns a Future that gives its entry once the file is back at
+        entry["src"], or raises the error that kept it from being restored; None
+        if there is nothing left to undo."""
+        with self.lock:
+            for entry in reversed(self.entries[self.session_start:]):
+                if entry["state"] in ("pending", "done") and not entry.get("undo"):
+                    entry["undo"] = True
+                    break
+            else:
+                return None
+        future = Future()
+        self.queue.put(("undo", entry, future))
+        return future
+
+    def replay(self):
+        """Queue the operations an earlier session left unfinished. Returns how many."""
+        todo = [e for e in self.entries if e["state"] == "pending"]
+        for entry in todo:
+            self.queue.put(("do", entry, None))
+        return len(todo)
+
+    def rollback(self):
+        """Queue the reversal of every finished operation, newest first. Returns how many."""
+        todo = [e for e in reversed(self.entries) if e["state"] == "done"]
+        for entry in todo:
+            entry["undo"] = True
+            self.queue.put(("undo", entry, None))
+        return len(todo)
+
+    def empty_trash(self):
+        """Remove the files of finished deletes from the trash for good, once
+        the queue is done. Returns (files removed, bytes freed)."""
+        self.flush()
+        removed = freed = 0
+        with self.lock:
+            todo = [e for e in self.entries if e["op"] == "delete" and e["state"] == "done"]
+        for entry in todo:
+            try:
+                size = os.path.getsize(entry["dst"])
+                os.remove(entry["dst"])
+            except FileNotFoundError:
+                # already gone, e.g. emptied by hand
+                size = 0
+            except OSError as e:
+                print(f"Error: empty trash {entry['dst']}: {e}")
+                continue
+            entry["state"] = "purged"
+            self._log({"id": entry["id"], "state": "purged"})
+            removed += 1
+            freed += size
+            # drop the trash folder once it is empty
+            try:
+                os.rmdir(entry["target_dir"])
+            except OSError:
+                pass
+        return removed, freed
+
+    def _do(self, entry):
+        if entry["state"] != "pending":
+            return
+        os.makedirs(entry["target_dir"], exist_ok=True)
+        dst = unique_path(os.path.join(entry["target_dir"], os.path.basename(entry["src"])))
+        if entry["op"] == "copy":
+            shutil.copyfile(entry["src"], dst)
+        else:
+            move_file(entry["src"], dst)
+        entry.update(dst=dst, state="done")
+        self._log({"id": entry["id"], "dst": dst, "state": "done"})
+
+    def _undo(self, entry):
+        if entry["state"] == "pending":
+            # never ran, e.g. queued by an earlier session that was cut short
+            entry["state"] = "undone"
+        elif entry["state"] == "done":
+            if entry["op"] == "copy":
+                os.remove(entry["dst"])
+            else:
+                if os.path.exists(entry["src"]):
+                    raise OSError(errno.EEXIST, "cannot restore, the original path is taken", entry["src"])
+                move_file(entry["dst"], entry["src"])
+            entry["state"] = "undone"
+        else:
+            return
+        self._log({"id": entry["id"], "state": "undone"})
+
+    def _run(self):
+        while True:
+            action, entry, future = self.queue.get()
+            try:
+                if action == "do":
+                    self._do(entry)
+                else:
+                    self._undo(entry)
+                if future is not None:
+                    future.set_result(entry)
+            except OSError as e:
+                if future is not None:
+                    future.set_exception(e)
+                if action == "do":
+                    entry["state"] = "failed"
+                    self._log({"id": entry["id"], "state": "failed", "error": str(e)})
+                else:
+                    # the operation itself still stands
+                    entry["undo"] = False
+                    self._log({"id": entry["id"], "error": str(e)})
+                print(f"Error: {action} {entry['op']} {entry['src']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued operation has been carried out."""
+        self.queue.join()
+
+# call callback(entry) on root's thread once an undo's future has succeeded,
+# checking every interval ms; a failed undo was already reported by the worker
+def when_undone(root, future, callback, interval=30):
+    if not future.done():
+        root.after(interval, when_undone, root, future, callback, interval)
+    elif future.exception() is None:
+        callback(future.result())
+
+def undo_into(root, file_ops, paths, index, show, interval=30):
+    """Undo the newest operation of file_ops for a viewer of paths. Once the
+    file is back in place, a moved or deleted image goes back into paths at
+    index(entry), unless that is None; copies never left it. show(entry) then
+    refreshes the viewer. A failed undo leaves paths as it is."""
+    def restore(entry):
+        if entry["op"] != "copy":
+            i = index(entry)
+            if i is not None:
+                paths.insert(min(i, len(paths)), entry["src"])
+        show(entry)
+
+    future = file_ops.undo()
+    if future is not None:
+        when_undone(root, future, restore, interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, finish or revert the file operations of a sorting session")
+    parser.add_argument("journal", help="JSONL journal written by the sorters")
+    parser.add_argument("--list", action="store_true", help="list the operations and their state")
+    parser.add_argument("--replay", action="store_true", help="carry out operations that were queued but never finished")
+    parser.add_argument("--rollback", action="store_true", help="undo every finished operation, newest first")
+    parser.add_argument("--empty-trash", action="store_true", help="remove deleted files from the trash for good; they cannot be undone afterwards")
+    args = parser.parse_args()
+
+    try:
+        if not os.path.exists(args.journal):
+            raise Exception(f"Error: no journal at {args.journal}")
+        ops = FileOps(args.journal)
+        if args.replay:
+            print(f"Replaying {ops.replay()} unfinished operations")
+        if args.rollback:
+            print(f"Rolling back {ops.rollback()} operations")
+        ops.flush()
+        if args.empty_trash:
+            removed, freed = ops.empty_trash()
+            print(f"Emptied {removed} files from the trash, freeing {freed / 1e6:.1f} MB")
+        if args.list or not (args.replay or args.rollback or args.empty_trash):
+            for entry in ops.entries:
+                print(f"{entry['id']:6} {entry['state']:8} {entry['op']:6} {entry['src']} -> {entry['dst'] or entry['target_dir']}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
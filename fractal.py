@@ -1,37 +1,170 @@
-from PIL import Image
-from numpy import array
+import argparse
 import colorsys
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from PIL import Image
 
-# setting the width, height and zoom
+# setting the default width, height and zoom
 WIDTH, HEIGHT = 512, 512
-ZOOM = 4
+ZOOM = 1
 
-# creating the new image in RGB mode
-im = Image.new("RGB", (WIDTH, HEIGHT))
+# width of the view in the complex plane at zoom 1
+BASE_SPAN = 4
 
-# some color constants to use
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
-
-# a function to calculate the color of a pixel based on its complex value
+# a function to calculate the escape-time iteration count of every point in c
 def mandelbrot(c, max_iter=100):
-    z = complex(0, 0)
+    c = np.asarray(c, dtype=np.complex128)
+    counts = np.full(c.shape, max_iter, dtype=np.int32)
+
+    # only the points that have not escaped yet are iterated, so the work
+    # shrinks as the set boundary is resolved
+    index = np.arange(c.size)
+    points = c.ravel()
+    z = np.zeros_like(points)
+    flat_counts = counts.reshape(-1)
     for i in range(max_iter):
-        z = z * z + c
-        if abs(z) > 2:
-            return i
-    return max_iter
+        z = z * z + points
+        escaped = (z.real * z.real + z.imag * z.imag) > 4
+        if escaped.any():
+            flat_counts[index[escaped]] = i
+            keep = ~escaped
+            index = index[keep]
+            points = points[keep]
+            z = z[keep]
+            if index.size == 0:
+                break
+    return counts
 
-# creating the Mandelbrot set
-for x in range(WIDTH):
-    for y in range(HEIGHT):
-        c = complex(x / WIDTH - 0.5, y / HEIGHT - 0.5) * ZOOM
-        color = mandelbrot(c)
+# a lookup table mapping every iteration count to an RGB colour, so the
+# per-pixel colour conversion becomes a single array index
+def make_palette(max_iter=100):
+    palette = np.zeros((max_iter + 1, 3), dtype=np.uint8)
+    for color in range(max_iter + 1):
         r, g, b = colorsys.hsv_to_rgb(color / 255, 1, 0.5)
-        im.putpixel((x, y), (int(r * 255), int(g * 255), int(b * 255)))
+        palette[color] = (int(r * 255), int(g * 255), int(b * 255))
+    return palette
+
+# the complex coordinates of every pixel in a frame, optionally restricted to
+# the sub-rectangle [x0, x1) x [y0, y1)
+def complex_grid(width, height, zoom=ZOOM, center=(0, 0), window=None):
+    x0, y0, x1, y1 = window if window is not None else (0, 0, width, height)
+    scale = BASE_SPAN / zoom / width
+    re = (np.arange(x0, x1) - width / 2) * scale + center[0]
+    im = (np.arange(y0, y1) - height / 2) * scale + center[1]
+    return re[np.newaxis, :] + 1j * im[:, np.newaxis]
+
+# render iteration counts into an RGB array with the palette
+def colorize(counts, max_iter=100, palette=None):
+    if palette is None:
+        palette = make_palette(max_iter)
+    return palette[counts]
+
+# creating the Mandelbrot set
+def render(width=WIDTH, height=HEIGHT, zoom=ZOOM, center=(0, 0), max_iter=100):
+    counts = mandelbrot(complex_grid(width, height, zoom, center), max_iter)
+    return Image.fromarray(colorize(counts, max_iter), "RGB")
+
+# split a frame into (x0, y0, x1, y1) tiles of at most tile_size pixels
+def tile_windows(width, height, tile_size):
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)]
+
+# estimate how many iterations each tile will cost from a coarse sample grid,
+# points inside the set cost max_iter and the boundary is where the counts pile up
+def estimate_tile_costs(windows, width, height, zoom, center, max_iter, samples=8):
+    scale = BASE_SPAN / zoom / width
+    costs = []
+    for x0, y0, x1, y1 in windows:
+        xs = np.linspace(x0, x1 - 1, samples)
+        ys = np.linspace(y0, y1 - 1, samples)
+        c = ((xs[np.newaxis, :] - width / 2) * scale + center[0]
+             + 1j * ((ys[:, np.newaxis] - height / 2) * scale + center[1]))
+        costs.append(int(mandelbrot(c, max_iter).sum()) + samples * samples)
+    return costs
+
+# worker: render one tile straight into the memory-mapped output buffer
+def _render_tile(buffer_path, window, width, height, zoom, center, max_iter):
+    x0, y0, x1, y1 = window
+    counts = mandelbrot(complex_grid(width, height, zoom, center, window), max_iter)
+    out = np.load(buffer_path, mmap_mode="r+")
+    out[y0:y1, x0:x1] = colorize(counts, max_iter)
+    out.flush()
+    del out
+    return window
+
+def _save_progress(progress_path, progress):
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+# render a frame too large for memory tile by tile on a process pool; tiles are
+# written into a memory-mapped .npy buffer and a progress file next to it
+# records the finished ones, so an interrupted render resumes where it stopped
+def render_tiled(buffer_path, width=WIDTH, height=HEIGHT, zoom=ZOOM, center=(0, 0),
+                 max_iter=100, tile_size=1024, workers=None, resume=True):
+    progress_path = buffer_path + ".progress.json"
+    params = {"width": width, "height": height, "zoom": zoom, "center": list(center),
+              "max_iter": max_iter, "tile_size": tile_size}
+
+    done = set()
+    if resume and os.path.exists(progress_path) and os.path.exists(buffer_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress["params"] == params:
+            done = {tuple(w) for w in progress["done"]}
+    if not done:
+        out = np.lib.format.open_memmap(buffer_path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+        del out
+    progress = {"params": params, "done": sorted(done)}
+    _save_progress(progress_path, progress)
+
+    # most expensive tiles first so no core is left with a long tile at the end
+    windows = [w for w in tile_windows(width, height, tile_size) if w not in done]
+    costs = estimate_tile_costs(windows, width, height, zoom, center, max_iter)
+    windows = [w for _, w in sorted(zip(costs, windows), reverse=True)]
 
-# showing the created fractal
-im.show()
+    total = len(done) + len(windows)
+    print(f"Rendering {len(windows)} tiles ({len(done)} already done)")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render_tile, buffer_path, w, width, height, zoom, center, max_iter)
+                   for w in windows]
+        for future in as_completed(futures):
+            done.add(future.result())
+            progress["done"] = sorted(done)
+            _save_progress(progress_path, progress)
+            print(f"{len(done)}/{total} tiles", end="\r")
+    print()
+    return np.load(buffer_path, mmap_mode="r")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the Mandelbrot set")
+    parser.add_argument("--width", type=int, default=WIDTH, help="image width in pixels")
+    parser.add_argument("--height", type=int, default=HEIGHT, help="image height in pixels")
+    parser.add_argument("--zoom", type=float, default=ZOOM, help="magnification, 1 shows the whole set")
+    parser.add_argument("--center", type=float, nargs=2, default=(0.0, 0.0), metavar=("RE", "IM"), help="center of the view in the complex plane")
+    parser.add_argument("--max-iter", type=int, default=100, help="maximum number of iterations per pixel")
+    parser.add_argument("-o", "--output", help="save the image to this path instead of showing it")
+    parser.add_argument("--tiled", metavar="BUFFER", help="render tile by tile into this memory-mapped .npy buffer, resuming an interrupted render")
+    parser.add_argument("--tile-size", type=int, default=1024, help="tile size in pixels for --tiled (default: 1024)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --tiled (default: all cores)")
+    parser.add_argument("--restart", action="store_true", help="ignore the progress of a previous --tiled render")
+    args = parser.parse_args()
 
+    if args.tiled:
+        buffer = render_tiled(args.tiled, args.width, args.height, args.zoom, tuple(args.center),
+                              args.max_iter, args.tile_size, args.workers, resume=not args.restart)
+        if not args.output:
+            parser.exit(message=f"Tiles written to {args.tiled}\n")
+        im = Image.fromarray(np.asarray(buffer), "RGB")
+    else:
+        im = render(args.width, args.height, args.zoom, tuple(args.center), args.max_iter)
 
+    # showing or saving the created fractal
+    if args.output:
+        im.save(args.output)
+    else:
+        im.show()
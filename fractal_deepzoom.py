@@ -0,0 +1,208 @@
+"""
+Deep-zoom Mandelbrot renderer using perturbation theory.
+
+Past a zoom of about 1e13 the pixel spacing drops below double precision and
+fractal.py renders blocks. Here a single reference orbit is computed at high
+precision (mpmath when installed, otherwise decimal) and every pixel is iterated
+with NumPy as a float64 offset from it:
+
+    dz' = 2 * Z[m] * dz + dz * dz + dc
+
+Rebasing (resetting to the start of the reference orbit whenever the pixel
+orbit gets closer to zero than its offset) keeps the offsets small. Pixels that
+still lose precision are detected with Pauldelbrot's criterion and re-rendered
+against a new reference taken from inside the glitched area.
+
+Usage:
+    python fractal_deepzoom.py --zoom 1e20 --center -0.743643887037158704752191506114774 0.131825904205311970493132056385139 --max-iter 2000 -o deep.png
+    python fractal_deepzoom.py --zoom 1e20 --center ... --benchmark
+"""
+
+import argparse
+import math
+import time
+from decimal import Decimal, localcontext
+
+import numpy as np
+from PIL import Image
+
+from fractal import WIDTH, HEIGHT, ZOOM, BASE_SPAN, colorize
+
+try:
+    import mpmath
+except ImportError:
+    mpmath = None
+
+# |z|^2 < GLITCH_TOLERANCE * |Z|^2 means the offset has swamped the reference
+GLITCH_TOLERANCE = 1e-6
+
+# decimal digits needed to resolve single pixels at a zoom level
+def precision_for_zoom(zoom, width=WIDTH):
+    return max(20, int(math.log10(max(zoom, 1) * width)) + 20)
+
+# iterate z = z * z + c at high precision, returning the orbit as complex128
+# values Z[0] = 0, Z[1] = c, ... until it escapes or reaches max_iter
+def reference_orbit(center_re, center_im, max_iter, digits):
+    orbit = [0j]
+    if mpmath is not None:
+        mpmath.mp.dps = digits
+        c = mpmath.mpc(mpmath.mpf(str(center_re)), mpmath.mpf(str(center_im)))
+        z = mpmath.mpc(0)
+        for _ in range(max_iter):
+            z = z * z + c
+            orbit.append(complex(z))
+            if z.real * z.real + z.imag * z.imag > 4:
+                break
+    else:
+        with localcontext() as ctx:
+            ctx.prec = digits
+            cr, ci = Decimal(str(center_re)), Decimal(str(center_im))
+            zr, zi = Decimal(0), Decimal(0)
+            for _ in range(max_iter):
+                zr, zi = zr * zr - zi * zi + cr, 2 * zr * zi + ci
+                orbit.append(complex(float(zr), float(zi)))
+                if zr * zr + zi * zi > 4:
+                    break
+    return np.array(orbit, dtype=np.complex128)
+
+# iterate every pixel offset dc against the reference orbit, returning the
+# iteration counts and a mask of the pixels whose result cannot be trusted
+def perturb(orbit, dc, max_iter, rebase=True):
+    dc = np.asarray(dc, dtype=np.complex128).ravel()
+    counts = np.full(dc.shape, max_iter, dtype=np.int32)
+    glitched = np.zeros(dc.shape, dtype=bool)
+    last = len(orbit) - 1
+    # a reference that escaped early runs out before max_iter
+    ref_escaped = last < max_iter
+
+    index = np.arange(dc.size)
+    dz = np.zeros_like(dc)
+    m = np.zeros(dc.shape, dtype=np.int64)
+    for i in range(max_iter):
+        dz = 2 * orbit[m] * dz + dz * dz + dc[index]
+        m += 1
+        z = orbit[m] + dz
+        mag = z.real * z.real + z.imag * z.imag
+
+        escaped = mag > 4
+        if rebase:
+            # restart the reference orbit when the pixel is closer to zero than
+            # its offset, or when the (escaped) reference has run out
+            dz_mag = dz.real * dz.real + dz.imag * dz.imag
+            restart = ~escaped & ((mag < dz_mag) | ((m == last) & ref_escaped))
+            dz[restart] = z[restart]
+            m[restart] = 0
+            bad = np.zeros_like(escaped)
+        else:
+            ref_mag = orbit[m].real ** 2 + orbit[m].imag ** 2
+            bad = ~escaped & ((mag < GLITCH_TOLERANCE * ref_mag) | ((m == last) & ref_escaped))
+            glitched[index[bad]] = True
+
+        counts[index[escaped]] = i
+        keep = ~(escaped | bad)
+        if not keep.all():
+            index, dz, m = index[keep], dz[keep], m[keep]
+            if index.size == 0:
+                break
+    return counts, glitched
+
+# pixel offsets from the frame center in the complex plane
+def pixel_offsets(width, height, zoom):
+    scale = BASE_SPAN / zoom / width
+    re = (np.arange(width) - width / 2) * scale
+    im = (np.arange(height) - height / 2) * scale
+    return re[np.newaxis, :] + 1j * im[:, np.newaxis]
+
+# render iteration counts for a frame centered on a high-precision point, given
+# as strings (or Decimals) so no digits are lost on the way in
+def deepzoom_counts(width=WIDTH, height=HEIGHT, zoom=ZOOM, center=("0", "0"), max_iter=100,
+                    rebase=True, max_references=10):
+    digits = precision_for_zoom(zoom, width)
+    offsets = pixel_offsets(width, height, zoom)
+    counts = np.zeros((height, width), dtype=np.int32)
+    todo = np.ones((height, width), dtype=bool)
+
+    ref = (Decimal(str(center[0])), Decimal(str(center[1])))
+    ref_offset = 0j
+    for _ in range(max_references):
+        orbit = reference_orbit(ref[0], ref[1], max_iter, digits)
+        result, glitched = perturb(orbit, offsets[todo] - ref_offset, max_iter, rebase)
+        counts[todo] = result
+        todo[todo] = glitched
+        if not todo.any():
+            break
+        # take the next reference from the middle of the remaining glitches
+        ys, xs = np.nonzero(todo)
+        pick = len(ys) // 2
+        ref_offset = offsets[ys[pick], xs[pick]]
+        with localcontext() as ctx:
+            ctx.prec = digits
+            ref = (Decimal(str(center[0])) + Decimal(ref_offset.real),
+                   Decimal(str(center[1])) + Decimal(ref_offset.imag))
+    return counts
+
+def render_deepzoom(width=WIDTH, height=HEIGHT, zoom=ZOOM, center=("0", "0"), max_iter=100, rebase=True):
+    counts = deepzoom_counts(width, height, zoom, center, max_iter, rebase)
+    return Image.fromarray(colorize(counts, max_iter), "RGB")
+
+# iterate a single pixel entirely at high precision, the way a naive
+# arbitrary-precision renderer would
+def naive_count(cr, ci, max_iter, digits):
+    with localcontext() as ctx:
+        ctx.prec = digits
+        zr, zi = Decimal(0), Decimal(0)
+        for i in range(max_iter):
+            zr, zi = zr * zr - zi * zi + cr, 2 * zr * zi + ci
+            if zr * zr + zi * zi > 4:
+                return i
+    return max_iter
+
+# time perturbation against naive arbitrary-precision iteration; the naive
+# renderer is timed on a sample of pixels and extrapolated to the full frame
+def benchmark(width, height, zoom, center, max_iter, samples=64):
+    start = time.perf_counter()
+    counts = deepzoom_counts(width, height, zoom, center, max_iter)
+    perturbation_time = time.perf_counter() - start
+
+    digits = precision_for_zoom(zoom, width)
+    offsets = pixel_offsets(width, height, zoom).ravel()
+    rng = np.random.default_rng(0)
+    picks = rng.choice(offsets.size, size=min(samples, offsets.size), replace=False)
+    mismatches = 0
+    start = time.perf_counter()
+    with localcontext() as ctx:
+        ctx.prec = digits
+        for p in picks:
+            cr = Decimal(str(center[0])) + Decimal(offsets[p].real)
+            ci = Decimal(str(center[1])) + Decimal(offsets[p].imag)
+            if naive_count(cr, ci, max_iter, digits) != counts.flat[p]:
+                mismatches += 1
+    naive_time = (time.perf_counter() - start) / len(picks) * offsets.size
+
+    print(f"Frame: {width}x{height}, zoom {zoom:g}, max_iter {max_iter}, {digits} digits")
+    print(f"Perturbation:                  {perturbation_time:10.2f} s")
+    print(f"Naive arbitrary precision:     {naive_time:10.2f} s (extrapolated from {len(picks)} pixels)")
+    print(f"Speedup:                       {naive_time / perturbation_time:10.1f}x")
+    print(f"Sampled pixels that disagree:  {mismatches}/{len(picks)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render deep zooms into the Mandelbrot set with perturbation")
+    parser.add_argument("--width", type=int, default=WIDTH, help="image width in pixels")
+    parser.add_argument("--height", type=int, default=HEIGHT, help="image height in pixels")
+    parser.add_argument("--zoom", type=float, default=ZOOM, help="magnification, 1 shows the whole set")
+    parser.add_argument("--center", nargs=2, default=("0", "0"), metavar=("RE", "IM"), help="center of the view, as many digits as the zoom needs")
+    parser.add_argument("--max-iter", type=int, default=100, help="maximum number of iterations per pixel")
+    parser.add_argument("-o", "--output", help="save the image to this path instead of showing it")
+    parser.add_argument("--no-rebase", action="store_true", help="fix glitches with extra references only, without rebasing")
+    parser.add_argument("--benchmark", action="store_true", help="compare against naive arbitrary-precision iteration")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.width, args.height, args.zoom, tuple(args.center), args.max_iter)
+    else:
+        im = render_deepzoom(args.width, args.height, args.zoom, tuple(args.center), args.max_iter,
+                             rebase=not args.no_rebase)
+        if args.output:
+            im.save(args.output)
+        else:
+            im.show()
@@ -0,0 +1,178 @@
+"""
+Render Mandelbrot zoom animations straight into ffmpeg.
+
+A zoom path is given as keyframes, either on the command line (a start and end
+view) or as a JSON file:
+
+    [
+        {"time": 0, "center": [-0.5, 0], "zoom": 1},
+        {"time": 20, "center": [-0.7436438870, 0.1318259042], "zoom": 1e6},
+        {"time": 60, "center": [-0.7436438870, 0.1318259042], "zoom": 1e12}
+    ]
+
+Zoom is interpolated exponentially and the center linearly between keyframes.
+Consecutive frames overlap almost entirely, so each frame takes its iteration
+counts from the previous one wherever the previous frame is flat (all nine
+neighbouring pixels share a count) and only iterates the remaining pixels.
+Runs of frames are rendered on a process pool, with a cap on how many runs are
+in flight so memory stays bounded, and are written to ffmpeg in order.
+
+Usage:
+    python fractal_zoom.py zoom.mp4 --keyframes path.json --width 3840 --height 2160 --fps 60
+    python fractal_zoom.py zoom.mp4 --center -0.7436438870 0.1318259042 --end-zoom 1e8 --duration 30
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fractal import WIDTH, HEIGHT, BASE_SPAN, mandelbrot, complex_grid, make_palette
+
+# load keyframes from a JSON file as (time, (re, im), zoom) tuples sorted by time
+def load_keyframes(path):
+    with open(path) as f:
+        frames = json.load(f)
+    keyframes = [(float(k["time"]), (float(k["center"][0]), float(k["center"][1])), float(k["zoom"]))
+                 for k in frames]
+    return sorted(keyframes)
+
+# the (center, zoom) view at time t along the keyframed path
+def view_at(keyframes, t):
+    if t <= keyframes[0][0]:
+        return keyframes[0][1], keyframes[0][2]
+    for (t0, c0, z0), (t1, c1, z1) in zip(keyframes, keyframes[1:]):
+        if t <= t1:
+            a = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+            center = (c0[0] + (c1[0] - c0[0]) * a, c0[1] + (c1[1] - c0[1]) * a)
+            zoom = math.exp(math.log(z0) + (math.log(z1) - math.log(z0)) * a)
+            return center, zoom
+    return keyframes[-1][1], keyframes[-1][2]
+
+# iteration counts taken over from the previous frame where it is flat, with
+# -1 marking the pixels that still have to be iterated
+def reuse_counts(prev_counts, prev_view, view, width, height):
+    (prev_center, prev_zoom), (center, zoom) = prev_view, view
+    prev_scale = BASE_SPAN / prev_zoom / width
+    scale = BASE_SPAN / zoom / width
+
+    # a pixel is flat when its 3x3 neighbourhood shares one count
+    padded = np.pad(prev_counts, 1, mode="constant", constant_values=-1)
+    flat = np.ones(prev_counts.shape, dtype=bool)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            flat &= padded[dy:dy + height, dx:dx + width] == prev_counts
+
+    # nearest previous pixel for every pixel of this frame
+    xs = (np.arange(width) - width / 2) * scale + center[0]
+    ys = (np.arange(height) - height / 2) * scale + center[1]
+    px = np.rint((xs - prev_center[0]) / prev_scale + width / 2).astype(np.int64)
+    py = np.rint((ys - prev_center[1]) / prev_scale + height / 2).astype(np.int64)
+    valid_x = (px >= 0) & (px < width)
+    valid_y = (py >= 0) & (py < height)
+
+    counts = np.full((height, width), -1, dtype=np.int32)
+    rows, cols = np.flatnonzero(valid_y), np.flatnonzero(valid_x)
+    if rows.size and cols.size:
+        src_y, src_x = np.ix_(py[rows], px[cols])
+        taken = np.where(flat[src_y, src_x], prev_counts[src_y, src_x], -1)
+        counts[np.ix_(rows, cols)] = taken
+    return counts
+
+# worker: render a run of consecutive frames, each reusing the one before it
+def _render_run(views, width, height, max_iter, reuse):
+    palette = make_palette(max_iter)
+    frames = []
+    prev_counts, prev_view = None, None
+    computed = 0
+    for view in views:
+        if reuse and prev_counts is not None:
+            counts = reuse_counts(prev_counts, prev_view, view, width, height)
+            todo = counts < 0
+            counts[todo] = mandelbrot(complex_grid(width, height, view[1], view[0])[todo], max_iter)
+            computed += int(todo.sum())
+        else:
+            counts = mandelbrot(complex_grid(width, height, view[1], view[0]), max_iter)
+            computed += counts.size
+        frames.append(palette[counts].tobytes())
+        prev_counts, prev_view = counts, view
+    return frames, computed
+
+def open_ffmpeg(output, width, height, fps, crf=18):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise Exception("Error: ffmpeg not found on PATH")
+    command = [ffmpeg, "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+               "-c:v", "libx264", "-crf", str(crf), "-pix_fmt", "yuv420p", output]
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+# render the whole path and stream it into ffmpeg
+def render_animation(output, keyframes, width=WIDTH, height=HEIGHT, fps=30, max_iter=100,
+                     run_length=8, workers=None, max_in_flight=None, reuse=True, crf=18):
+    duration = keyframes[-1][0] - keyframes[0][0]
+    total = max(1, int(round(duration * fps)))
+    views = [view_at(keyframes, keyframes[0][0] + i / fps) for i in range(total)]
+    runs = [views[i:i + run_length] for i in range(0, total, run_length)]
+
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers + 1
+    ffmpeg = open_ffmpeg(output, width, height, fps, crf)
+    written = computed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            next_run = 0
+            while next_run < len(runs) or pending:
+                # keep at most max_in_flight runs rendering or waiting to be written
+                while next_run < len(runs) and len(pending) < max_in_flight:
+                    pending.append(pool.submit(_render_run, runs[next_run], width, height, max_iter, reuse))
+                    next_run += 1
+                frames, run_computed = pending.popleft().result()
+                for frame in frames:
+                    ffmpeg.stdin.write(frame)
+                written += len(frames)
+                computed += run_computed
+                print(f"{written}/{total} frames", end="\r")
+    finally:
+        ffmpeg.stdin.close()
+        ffmpeg.wait()
+    print()
+    print(f"Iterated {computed / (total * width * height):.0%} of all pixels")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a Mandelbrot zoom animation into a video")
+    parser.add_argument("output", help="output video file, e.g. zoom.mp4")
+    parser.add_argument("--keyframes", help="JSON file of {time, center, zoom} keyframes")
+    parser.add_argument("--width", type=int, default=WIDTH, help="frame width in pixels")
+    parser.add_argument("--height", type=int, default=HEIGHT, help="frame height in pixels")
+    parser.add_argument("--center", type=float, nargs=2, default=(0.0, 0.0), metavar=("RE", "IM"), help="center to zoom into when no keyframes are given")
+    parser.add_argument("--start-zoom", type=float, default=1, help="zoom of the first frame when no keyframes are given")
+    parser.add_argument("--end-zoom", type=float, default=1e6, help="zoom of the last frame when no keyframes are given")
+    parser.add_argument("--duration", type=float, default=10, help="length in seconds when no keyframes are given")
+    parser.add_argument("--fps", type=int, default=30, help="frames per second")
+    parser.add_argument("--max-iter", type=int, default=100, help="maximum number of iterations per pixel")
+    parser.add_argument("--crf", type=int, default=18, help="x264 quality, lower is better")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--run-length", type=int, default=8, help="consecutive frames rendered by one worker, sharing work")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="runs held in memory at once (default: workers + 1)")
+    parser.add_argument("--no-reuse", action="store_true", help="iterate every pixel of every frame")
+    args = parser.parse_args()
+
+    if args.keyframes:
+        keyframes = load_keyframes(args.keyframes)
+    else:
+        center = tuple(args.center)
+        keyframes = [(0.0, center, args.start_zoom), (args.duration, center, args.end_zoom)]
+
+    try:
+        render_animation(args.output, keyframes, args.width, args.height, args.fps, args.max_iter,
+                         args.run_length, args.workers, args.max_in_flight, not args.no_reuse, args.crf)
+    except Exception as e:
+        print(f"Error: {str(e)}")
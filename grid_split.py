@@ -1,51 +1,395 @@
 import os
-import cv2
+import math
+import time
 import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageFile
+
+# gigapixel scans are what this script is for, so the pixel limits of PIL and
+# cv2 are lifted; cv2 reads its own once, on first use
+Image.MAX_IMAGE_PIXELS = None
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(1 << 40))
+import cv2
+
+# only needed to stream JPEG, PNG and compressed TIFF
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+# newer PIL versions describe tiles as named tuples
+Tile = getattr(ImageFile, "_Tile", lambda *fields: fields)
+
+class BandReader:
+    """
+    Reads horizontal bands of rows from an image file without decoding the rest of it.
+
+    PIL describes where an image's pixels are in the file as a list of tiles. For
+    uncompressed TIFF strips and tiles, PPM and BMP those are raw bytes, so the rows
+    of one band can be decoded on their own by pointing PIL at just the part of
+    the file that holds them. Other formats (JPEG, PNG, compressed TIFF) need
+    their real decoder; for them `streamable` is False.
+    """
+
+    def __init__(self, image_path):
+        self.image_path = image_path
+        with Image.open(image_path) as image:
+            self.size = image.size
+            self.mode = image.mode
+            self.tiles = [tuple(tile) for tile in image.tile]
+            self.streamable = bool(self.tiles) and all(tile[0] == "raw" for tile in self.tiles)
+            # an orientation tag would have PIL rotate each band on its own; only
+            # looked up for raw images, as a PNG is decoded in full to find it
+            if self.streamable and image.getexif().get(0x0112, 1) != 1:
+                self.streamable = False
+        if self.streamable:
+            try:
+                self.tiles = [self._raw_tile(tile) for tile in self.tiles]
+            except Exception:
+                self.streamable = False
+
+    # a raw tile with its arguments spelled out as (rawmode, stride, orientation)
+    def _raw_tile(self, tile):
+        _, extents, offset, args = tile
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = tuple(args) + (0, 1)[len(args) - 1:]
+        if stride <= 0:
+            # bytes per row of the tile, as PIL's raw decoder would work it out
+            stride = len(Image.new(self.mode, (extents[2] - extents[0], 1)).tobytes("raw", rawmode))
+        return extents, offset, (rawmode, stride, orientation)
+
+    def read(self, top, bottom):
+        """Decode rows top to bottom (exclusive) into an RGB array."""
+        band_tiles = []
+        for (x0, y0, x1, y1), offset, (rawmode, stride, orientation) in self.tiles:
+            start, stop = max(y0, top), min(y1, bottom)
+            if start >= stop:
+                continue
+            # rows are stored top down, or bottom up for a negative orientation
+            if orientation < 0:
+                band_offset = offset + (y1 - stop) * stride
+            else:
+                band_offset = offset + (start - y0) * stride
+            band_tiles.append(Tile("raw", (x0, start - top, x1, stop - top), band_offset, (rawmode, stride, orientation)))
 
-def split_image_into_tiles(image_path, rows, cols, output_dir):
+        image = Image.open(self.image_path)
+        try:
+            image._size = (self.size[0], bottom - top)
+            image.tile = band_tiles
+            image.load()
+            return np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        finally:
+            image.close()
+
+class VipsBandReader:
+    """
+    Reads horizontal bands of rows, top to bottom, from any image libvips can open.
+
+    Opened for sequential access, libvips decodes JPEG, PNG and compressed TIFF
+    a few rows at a time as they are asked for, so bands must be read in order.
+    Images with an orientation tag are left to the full decode, which applies it.
+    """
+
+    def __init__(self, image_path):
+        image = pyvips.Image.new_from_file(image_path, access="sequential")
+        self.streamable = not (image.get_typeof("orientation") and image.get("orientation") != 1)
+        # 8-bit RGB without alpha, as BandReader gives
+        if image.hasalpha():
+            image = image[:-1]
+        if image.interpretation != "srgb" or image.bands != 3:
+            image = image.colourspace("srgb")
+        if image.format != "uchar":
+            image = image.cast("uchar")
+        self.size = (image.width, image.height)
+        self.bands = image.bands
+        self.region = pyvips.Region.new(image)
+
+    def read(self, top, bottom):
+        """Decode rows top to bottom (exclusive) into an RGB array."""
+        data = self.region.fetch(0, top, self.size[0], bottom - top)
+        return np.frombuffer(data, np.uint8).reshape(bottom - top, self.size[0], self.bands)
+
+def save_tile(tile, tile_path):
+    """
+    Encode one tile taken from an RGB band and write it to disk.
+    """
+    if not cv2.imwrite(tile_path, cv2.cvtColor(tile, cv2.COLOR_RGB2BGR)):
+        raise Exception(f"Error: could not write {tile_path}")
+
+def open_bands(image_path):
+    """
+    Returns ((width, height), read_band) for an image, where read_band(top, bottom)
+    gives those rows as an RGB array: decoded on their own where BandReader can,
+    or VipsBandReader when pyvips is installed, else sliced from the image
+    decoded in full. Bands are read from the top down.
+    """
+    reader = BandReader(image_path)
+    if reader.streamable:
+        return reader.size, reader.read
+    if pyvips is not None:
+        try:
+            reader = VipsBandReader(image_path)
+        except pyvips.Error as e:
+            print(f"libvips cannot open {image_path}: {e}")
+        else:
+            if reader.streamable:
+                return reader.size, reader.read
+
+    # Load the image, converting it to RGB in place so it is only held once
+    print(f"{image_path} cannot be read in bands{'' if pyvips else ' without pyvips'}, decoding it in full")
+    try:
+        image = cv2.imread(image_path)
+    except cv2.error:
+        image = None
+    if image is None:
+        raise Exception(f"Error: could not read {image_path}")
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return (image.shape[1], image.shape[0]), lambda top, bottom: image[top:bottom]
+
+def split_image_into_tiles(image_path, rows, cols, output_dir, workers=None):
     """
     This function splits an input image into a grid of tiles and saves each tile into a subdirectory.
-    
+
+    The image is read one row of tiles at a time where its format allows (see
+    BandReader and VipsBandReader), so memory stays around two bands however
+    large the image is: one being encoded by the worker pool while the next is
+    read. Other images are decoded in full first.
+
     Parameters:
         image_path (str): The path to the input image.
         rows (int): The number of rows in the grid.
         cols (int): The number of columns in the grid.
         output_dir (str): The path to the directory where the tiles will be saved.
+        workers (int): The number of threads encoding tiles (default: all cores).
     """
-    # Load the image
-    image = cv2.imread(image_path)
-    
     # Get the dimensions of the image
-    height, width, _ = image.shape
-    
+    (width, height), read_band = open_bands(image_path)
+
     # Calculate the size of each tile
     tile_height = height // rows
     tile_width = width // cols
-    
-    # Loop over the rows and columns in the grid
-    for row in range(rows):
-        for col in range(cols):
-            # Calculate the starting and ending row and column indices for the current tile
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        pending = []
+        # Loop over the rows of the grid, one band of tiles at a time
+        for row in range(rows):
+            # Calculate the starting and ending row indices for the current band
             start_row = row * tile_height
             end_row = start_row + tile_height
-            start_col = col * tile_width
-            end_col = start_col + tile_width
-            
-            # Extract the current tile from the image
-            tile = image[start_row:end_row, start_col:end_col]
-            
-            # Save the current tile to disk
-            tile_path = os.path.join(output_dir, f"tile_{row}_{col}.jpg")
-            cv2.imwrite(tile_path, tile)
+            band = read_band(start_row, end_row)
+
+            # The previous band is done with once its tiles are written
+            for future in pending:
+                future.result()
+            pending = []
+
+            for col in range(cols):
+                # Calculate the starting and ending column indices for the current tile
+                start_col = col * tile_width
+                end_col = start_col + tile_width
+
+                # Extract the current tile from the band and save it on the pool
+                tile = band[:, start_col:end_col]
+                tile_path = os.path.join(output_dir, f"tile_{row}_{col}.jpg")
+                pending.append(pool.submit(save_tile, tile, tile_path))
+        for future in pending:
+            future.result()
+
+def halve(rows):
+    """
+    Downsample RGB rows by two in each direction, averaging 2x2 blocks. An odd
+    last row or column is averaged with itself, so edge pixels keep their colour.
+    """
+    if len(rows) % 2:
+        rows = np.concatenate((rows, rows[-1:]))
+    if rows.shape[1] % 2:
+        rows = np.concatenate((rows, rows[:, -1:]), axis=1)
+    total = rows[0::2, 0::2].astype(np.uint16) + rows[1::2, 0::2] + rows[0::2, 1::2] + rows[1::2, 1::2]
+    return ((total + 2) >> 2).astype(np.uint8)
+
+class PyramidLevel:
+    """
+    One level of an image pyramid, fed its rows from top to bottom.
+
+    Rows are buffered until a whole row of tiles, overlap included, is there;
+    those tiles are handed to save(tile, level, col, row) and rows no later tile
+    needs are dropped. Every row is also halved and passed on to the next
+    smaller level, so all levels are built in the same pass over the source.
+    """
+
+    def __init__(self, level, width, height, tile_size, overlap, save, below=None):
+        self.level = level
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.save = save
+        self.below = below
+        self.cols = math.ceil(width / tile_size)
+        self.rows = math.ceil(height / tile_size)
+        self.buffer = np.zeros((0, width, 3), np.uint8)
+        # image row of the first buffered row
+        self.top = 0
+        self.received = 0
+        self.next_row = 0
+        # a row waiting for its partner before it can be halved
+        self.unpaired = None
+
+    # the pixels tile index covers along a side of length, overlap included
+    def span(self, index, length):
+        start = max(index * self.tile_size - self.overlap, 0)
+        end = min((index + 1) * self.tile_size + self.overlap, length)
+        return start, end
+
+    def add(self, rows):
+        self.received += len(rows)
+        self.buffer = np.concatenate((self.buffer, rows))
+
+        # Emit every row of tiles whose last row has arrived
+        while self.next_row < self.rows:
+            start_row, end_row = self.span(self.next_row, self.height)
+            if self.received < end_row:
+                break
+            band = self.buffer[start_row - self.top:end_row - self.top]
+            for col in range(self.cols):
+                start_col, end_col = self.span(col, self.width)
+                self.save(band[:, start_col:end_col], self.level, col, self.next_row)
+            self.next_row += 1
+            keep_from = self.next_row * self.tile_size - self.overlap
+            if keep_from > self.top:
+                self.buffer = self.buffer[keep_from - self.top:]
+                self.top = keep_from
+
+        # Pass the rows on to the next level, in pairs until the last one
+        if self.below is not None:
+            if self.unpaired is not None:
+                rows = np.concatenate((self.unpaired, rows))
+                self.unpaired = None
+            if len(rows) % 2 and self.received < self.height:
+                self.unpaired = rows[-1:]
+                rows = rows[:-1]
+            if len(rows):
+                self.below.add(halve(rows))
+
+def build_pyramid(image_path, output_dir, tile_size=254, overlap=1, layout="dzi", tile_format="jpg", workers=None):
+    """
+    This function builds a multi-resolution tile pyramid of an image for deep-zoom viewers.
+
+    Every level is half the size of the one above it, down to 1x1 for DZI or to
+    the level that fits in a single tile for XYZ, and is made by downsampling
+    the level above rather than the original. The source is read once, band by
+    band where its format allows (see open_bands); all levels cut their tiles
+    as rows arrive and a pool of threads encodes them, so memory stays around a
+    band per level however large the image is. Edge tiles are as wide and tall
+    as what is left of the level, and tiles overlap their neighbours by overlap
+    pixels on each inner side.
+
+    Parameters:
+        image_path (str): The path to the input image.
+        output_dir (str): The path to the directory where the pyramid will be saved.
+        tile_size (int): The size of the tiles, without overlap.
+        overlap (int): The number of pixels each tile shares with its neighbours.
+        layout (str): "dzi" for name.dzi with name_files/level/col_row tiles, or
+            "xyz" for z/x/y tiles with z = 0 the single-tile level. XYZ viewers
+            expect every tile to be tile_size square, so there is no overlap
+            and edge tiles are padded with black.
+        tile_format (str): "jpg" or "png".
+        workers (int): The number of threads encoding tiles (default: all cores).
+    """
+    start = time.perf_counter()
+    (width, height), read_band = open_bands(image_path)
+
+    # DZI level n is the full image, each level below it half the size
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+    sizes = [(math.ceil(width / 2 ** (max_level - level)), math.ceil(height / 2 ** (max_level - level)))
+             for level in range(max_level + 1)]
+    if layout == "xyz":
+        overlap = 0
+        min_level = max(level for level, (w, h) in enumerate(sizes) if w <= tile_size and h <= tile_size)
+    else:
+        min_level = 0
+
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    if layout == "dzi":
+        tiles_dir = os.path.join(output_dir, f"{name}_files")
+        tile_path = lambda level, col, row: os.path.join(tiles_dir, str(level), f"{col}_{row}.{tile_format}")
+    else:
+        tiles_dir = output_dir
+        tile_path = lambda level, col, row: os.path.join(tiles_dir, str(level - min_level), str(col), f"{row}.{tile_format}")
+
+    # Create the directories of every level once, up front
+    for level in range(min_level, max_level + 1):
+        if layout == "dzi":
+            os.makedirs(os.path.join(tiles_dir, str(level)), exist_ok=True)
+        else:
+            for col in range(math.ceil(sizes[level][0] / tile_size)):
+                os.makedirs(os.path.join(tiles_dir, str(level - min_level), str(col)), exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        # tiles waiting to be encoded keep their rows alive, so only a bounded
+        # number of them may be queued
+        pending = deque()
+        max_pending = (workers or os.cpu_count()) * 8
+        count = 0
+
+        def save(tile, level, col, row):
+            nonlocal count
+            while len(pending) >= max_pending:
+                pending.popleft().result()
+            if layout == "xyz" and tile.shape[:2] != (tile_size, tile_size):
+                tile = np.pad(tile, ((0, tile_size - tile.shape[0]), (0, tile_size - tile.shape[1]), (0, 0)))
+            pending.append(pool.submit(save_tile, tile, tile_path(level, col, row)))
+            count += 1
+
+        # Chain the levels from the smallest up, then feed the largest the source
+        below = None
+        for level in range(min_level, max_level + 1):
+            below = PyramidLevel(level, *sizes[level], tile_size, overlap, save, below)
+        for top in range(0, height, tile_size):
+            below.add(read_band(top, min(top + tile_size, height)))
+        while pending:
+            pending.popleft().result()
+
+    if layout == "dzi":
+        with open(os.path.join(output_dir, f"{name}.dzi"), "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{tile_format}" '
+                    f'Overlap="{overlap}" TileSize="{tile_size}">\n'
+                    f'  <Size Width="{width}" Height="{height}"/>\n'
+                    '</Image>\n')
+    print(f"Wrote {count} tiles in {max_level - min_level + 1} levels in {time.perf_counter() - start:.1f} s")
 
 if __name__ == "__main__":
     # Parse the command line arguments
-    parser = argparse.ArgumentParser(description="Split an image into a grid of tiles")
+    parser = argparse.ArgumentParser(description="Split an image into a grid of tiles, or into a deep-zoom tile pyramid",
+                                     epilog="Uncompressed TIFF, PPM and BMP images are read a band at a time. "
+                                            "JPEG, PNG and compressed TIFF are too when pyvips is installed; "
+                                            "otherwise they, like other formats, are decoded in full first, "
+                                            "which needs memory for the whole image.")
     parser.add_argument("image_path", help="The path to the input image.")
-    parser.add_argument("rows", type=int, help="The number of rows in the grid.")
-    parser.add_argument("cols", type=int, help="The number of columns in the grid.")
-    parser.add_argument("output_dir", help="The path to the directory where the tiles will be saved.")
+    parser.add_argument("rows", type=int, nargs="?", help="The number of rows in the grid.")
+    parser.add_argument("cols", type=int, nargs="?", help="The number of columns in the grid.")
+    parser.add_argument("output_dir", nargs="?", help="The path to the directory where the tiles will be saved.")
+    parser.add_argument("--pyramid", metavar="DIR", help="Build a tile pyramid in this directory instead of a grid.")
+    parser.add_argument("--layout", choices=("dzi", "xyz"), default="dzi", help="The pyramid layout (default: dzi).")
+    parser.add_argument("--tile-size", type=int, default=254, help="The pyramid tile size, without overlap (default: 254).")
+    parser.add_argument("--overlap", type=int, default=1, help="The pixels pyramid tiles share with their neighbours (default: 1).")
+    parser.add_argument("--format", choices=("jpg", "png"), default="jpg", help="The pyramid tile format (default: jpg).")
+    parser.add_argument("--workers", type=int, default=None, help="The number of threads encoding tiles (default: all cores).")
     args = parser.parse_args()
-    
-    # Call the split_image_into_tiles function with the parsed arguments
-    split_image_into_tiles(args.image_path, args.rows, args.cols, args.output_dir)
+    if not args.pyramid and args.output_dir is None:
+        parser.error("rows, cols and output_dir are required without --pyramid")
+
+    # Call the split_image_into_tiles or build_pyramid function with the parsed arguments
+    try:
+        if args.pyramid:
+            build_pyramid(args.image_path, args.pyramid, args.tile_size, args.overlap, args.layout, args.format, args.workers)
+        else:
+            split_image_into_tiles(args.image_path, args.rows, args.cols, args.output_dir, args.workers)
+    except Exception as e:
+        print(f"Error: {str(e)}")
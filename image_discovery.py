@@ -0,0 +1,164 @@
+"""
+Find image files with os.scandir, shared by the image sorters and galleries.
+
+os.scandir hands back the file type with every directory entry, so telling
+files from directories costs no extra stat call per entry the way
+os.listdir + os.path.isdir does. Extensions are matched case-insensitively.
+Results are yielded lazily, directory by directory in sorted order, so a viewer
+can show the first image while the rest of a large tree is still being listed.
+
+On network mounts, where every listing is a round trip, subdirectories can be
+listed on a thread pool ahead of the consumer with workers=N. With sniff=True
+files are recognised by their magic bytes instead of their extension, which
+finds misnamed images at the cost of opening every file.
+
+Hidden directories (starting with a dot) are skipped, which also keeps the
+.trash folders file_ops.py moves deleted images into out of the results.
+
+Usage:
+    python image_discovery.py photos/
+    python image_discovery.py //nas/photos --workers 16 --benchmark
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+
+# leading bytes of the formats above
+MAGIC_NUMBERS = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"BM", b"II*\x00", b"MM\x00*")
+
+# is the file an image, judging by its first bytes
+def sniff_image(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return False
+    if head.startswith(MAGIC_NUMBERS):
+        return True
+    return head[:4] == b"RIFF" and head[8:12] == b"WEBP"
+
+# list one directory, returning its (image files, subdirectories) sorted by name;
+# unreadable directories are skipped like os.walk does
+def _scan_dir(directory, extensions, sniff):
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    # symlinked directories are not followed, so links cannot loop
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.path)
+                    elif entry.is_file():
+                        if sniff:
+                            if sniff_image(entry.path):
+                                files.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in extensions:
+                            files.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        return [], []
+    files.sort()
+    subdirs.sort()
+    return files, subdirs
+
+# lazily yield the image files under directory, depth first and sorted
+def iter_images(directory, recursive=True, extensions=IMAGE_EXTENSIONS, sniff=False, workers=None):
+    extensions = tuple(e.lower() for e in extensions)
+    if not workers:
+        pending = [directory]
+        while pending:
+            files, subdirs = _scan_dir(pending.pop(), extensions, sniff)
+            yield from files
+            if recursive:
+                pending.extend(reversed(subdirs))
+        return
+
+    # with a pool the listings of every known subdirectory are already in
+    # flight while the consumer works through the current one
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = [pool.submit(_scan_dir, directory, extensions, sniff)]
+        while pending:
+            files, subdirs = pending.pop().result()
+            yield from files
+            if recursive:
+                pending.extend(pool.submit(_scan_dir, d, extensions, sniff) for d in reversed(subdirs))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def find_images(directory, recursive=True, extensions=IMAGE_EXTENSIONS, sniff=False, workers=None):
+    return list(iter_images(directory, recursive, extensions, sniff, workers))
+
+# list the image files under directory in the same order as iter_images, and
+# return them with a snapshot {dir: {"mtime_ns", "files", "subdirs"}} of the
+# tree; a directory whose mtime matches the previous snapshot is not listed
+# again, since adding, removing or renaming an entry changes its mtime
+def snapshot_images(directory, extensions=IMAGE_EXTENSIONS, previous=None):
+    extensions = tuple(e.lower() for e in extensions)
+    previous = previous or {}
+    files, dirs = [], {}
+    pending = [directory]
+    while pending:
+        path = pending.pop()
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        entry = previous.get(path)
+        if entry is None or entry["mtime_ns"] != mtime_ns:
+            found, subdirs = _scan_dir(path, extensions, False)
+            entry = {"mtime_ns": mtime_ns, "files": found, "subdirs": subdirs}
+        dirs[path] = entry
+        files.extend(entry["files"])
+        pending.extend(reversed(entry["subdirs"]))
+    return files, dirs
+
+# the os.listdir + os.path.isdir recursion the sorters used to do
+def _listdir_images(directory, extensions):
+    images = []
+    for filename in sorted(os.listdir(directory)):
+        filepath = os.path.join(directory, filename)
+        if os.path.isdir(filepath):
+            images += _listdir_images(filepath, extensions)
+        elif filename.lower().endswith(extensions):
+            images.append(filepath)
+    return images
+
+def benchmark(directory, workers=None):
+    start = time.perf_counter()
+    old = _listdir_images(directory, IMAGE_EXTENSIONS)
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in iter_images(directory, workers=workers):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    new_time = time.perf_counter() - start
+
+    print(f"os.listdir + isdir: {len(old)} images in {old_time:.3f} s")
+    print(f"os.scandir:         {count} images in {new_time:.3f} s, first after {first or 0:.4f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the image files under a directory")
+    parser.add_argument("directory", nargs="?", default=".", help="directory to search (default: current directory)")
+    parser.add_argument("--no-recursive", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--sniff", action="store_true", help="recognise images by their magic bytes instead of their extension")
+    parser.add_argument("--workers", type=int, default=None, help="list subdirectories on this many threads, for network mounts")
+    parser.add_argument("--benchmark", action="store_true", help="time against os.listdir + os.path.isdir")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.directory, args.workers)
+    else:
+        for path in iter_images(args.directory, not args.no_recursive, sniff=args.sniff, workers=args.workers):
+            sys.stdout.write(path + "\n")
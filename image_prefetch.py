@@ -0,0 +1,160 @@
+"""
+Background prefetching of decoded, screen-sized images for the viewers.
+
+Decoding and downsizing a large photo takes far longer than a keypress should.
+A Prefetcher decodes the next and previous few images on worker threads into a
+byte-bounded LRU cache, so stepping through a folder finds the image already
+waiting. When the user jumps, queued work for images that are no longer near
+the current one is cancelled, and a generation counter makes workers skip jobs
+that went stale before they started.
+
+Only PIL images are cached; Tk PhotoImages must still be created on the Tk
+thread by the viewer.
+"""
+
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# memory held by a decoded image
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+# least recently used images are dropped once the cache holds more than max_bytes
+class PreviewCache:
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            image = self.items.get(key)
+            if image is not None:
+                self.items.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.items:
+                self.bytes -= image_bytes(self.items.pop(key))
+            self.items[key] = image
+            self.bytes += image_bytes(image)
+            while self.bytes > self.max_bytes and len(self.items) > 1:
+                _, old = self.items.popitem(last=False)
+                self.bytes -= image_bytes(old)
+
+    # drop every cached size of a file, e.g. after it was deleted
+    def discard(self, path):
+        with self.lock:
+            for key in [k for k in self.items if k[0] == path]:
+                self.bytes -= image_bytes(self.items.pop(key))
+
+class Prefetcher:
+    """Serves loader(path, size) results from a cache that workers keep filled
+    with the images around the current one.
+
+    loader must return a fully loaded PIL image.
+    """
+
+    def __init__(self, loader, radius=3, max_bytes=256 << 20, workers=2):
+        self.loader = loader
+        self.radius = radius
+        self.cache = PreviewCache(max_bytes)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.wanted = set()
+        self.generation = 0
+        # reentrant, cancelling a future runs its done callback on this thread
+        self.lock = threading.RLock()
+
+    def _load(self, key, generation):
+        with self.lock:
+            if generation != self.generation and key not in self.wanted:
+                return None
+        image = self.loader(*key)
+        self.cache.put(key, image)
+        return image
+
+    def _finished(self, key, future):
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    def get(self, paths, index, size):
+        """Returns (image for paths[index], whether it was ready in the cache) and
+        starts prefetching its neighbours."""
+        key = (paths[index], size)
+        image = self.cache.get(key)
+        hit = image is not None
+        if image is None:
+            with self.lock:
+                future = self.pending.get(key)
+            # a job that is already decoding is waited for, a queued one is
+            # cancelled and done right here instead
+            if future is not None and not future.cancel():
+                image = future.result()
+            if image is None:
+                image = self.loader(*key)
+                self.cache.put(key, image)
+        self.schedule(paths, index, size)
+        return image, hit
+
+    def schedule(self, paths, index, size):
+        # nearest first, alternating forward and backward
+        order = []
+        for step in range(1, self.radius + 1):
+            for i in (index + step, index - step):
+                key = (paths[i % len(paths)], size)
+                if key not in order:
+                    order.append(key)
+        with self.lock:
+            self.generation += 1
+            self.wanted = set(order)
+            for key, future in list(self.pending.items()):
+                if key not in self.wanted:
+                    future.cancel()
+            for key in order:
+                if key in self.pending or self.cache.get(key) is not None:
+                    continue
+                future = self.pool.submit(self._load, key, self.generation)
+                self.pending[key] = future
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+
+    def discard(self, path):
+        self.cache.discard(path)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+# time from a keypress or button press until the new image is on screen
+class LatencyLog:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.samples = []
+        self.action = None
+        self.start_time = None
+
+    def start(self, action):
+        if self.enabled:
+            self.action = action
+            self.start_time = time.perf_counter()
+
+    def stop(self, detail=""):
+        if self.start_time is None:
+            return
+        ms = (time.perf_counter() - self.start_time) * 1000
+        self.start_time = None
+        self.samples.append(ms)
+        print(f"{self.action}: {ms:.1f} ms {detail}")
+
+    def report(self):
+        if not self.samples:
+            return
+        samples = sorted(self.samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{len(samples)} keypresses: median {statistics.median(samples):.1f} ms, "
+              f"95th percentile {p95:.1f} ms, worst {samples[-1]:.1f} ms")
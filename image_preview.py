@@ -0,0 +1,115 @@
+"""
+Decode images at screen size instead of full resolution, shared by the viewers.
+
+A viewer only ever shows an image at a few hundred to a few thousand pixels,
+yet decoding a camera JPEG in full and then shrinking it costs the full decode
+time and memory. JPEG and JPEG2000 can decode at a reduced scale directly:
+
+    JPEG       Image.draft() has the decoder skip DCT coefficients, giving
+               1/2, 1/4 or 1/8 of the resolution (MPO, the multi-picture
+               JPEG many cameras write, included)
+    JPEG2000   setting reduce drops wavelet resolution levels
+
+Other formats are decoded in full, shrunk with a fast integer box reduce to
+about twice the target size, and only then resampled with a proper filter.
+Palette, bilevel and 16-bit or float images are converted to RGB(A) or L
+first, since neither reduce nor a filtered resize works on them.
+
+Usage:
+    python image_preview.py photo.jpg --size 800 600 --benchmark
+"""
+
+import argparse
+import time
+
+from PIL import Image
+
+# the size of image scaled to fit inside a (width, height) box, keeping its aspect
+def fit_size(image_size, size, upscale=False):
+    scale = min(size[0] / image_size[0], size[1] / image_size[1])
+    if scale >= 1 and not upscale:
+        return image_size
+    return max(1, int(image_size[0] * scale)), max(1, int(image_size[1] * scale))
+
+# decode an image at the lowest resolution its format offers that is still at
+# least target, returning the loaded image
+def decode_reduced(path, target):
+    image = Image.open(path)
+    # cameras often write MPO (a JPEG with extra frames), which draft handles too
+    if image.format in ("JPEG", "MPO"):
+        # draft picks the smallest DCT scale that is still at least target
+        image.draft(None, target)
+    elif image.format == "JPEG2000":
+        reduce = 0
+        while image.size[0] >> (reduce + 1) >= target[0] and image.size[1] >> (reduce + 1) >= target[1]:
+            reduce += 1
+        image.reduce = reduce
+    image.load()
+    return image
+
+# the image in a mode reduce and filtered resizing support: palette images
+# become RGB, or RGBA if they have transparency, bilevel and wide grayscale L
+def display_mode(image):
+    if image.mode in ("P", "PA"):
+        transparent = image.mode == "PA" or "transparency" in image.info
+        return image.convert("RGBA" if transparent else "RGB")
+    if image.mode == "1" or image.mode == "F":
+        return image.convert("L")
+    if image.mode.startswith("I"):
+        image = image.convert("I")
+        # 16-bit samples are scaled down to 8 bits, not clipped
+        if image.getextrema()[1] > 255:
+            image = image.point(lambda v: v / 256)
+        return image.convert("L")
+    return image
+
+# open an image decoded at no more resolution than needed to fit size, then
+# scaled to fit it exactly; the result is fully loaded
+def open_preview(path, size, upscale=False, resample=Image.LANCZOS):
+    with Image.open(path) as image:
+        target = fit_size(image.size, size, upscale)
+    image = display_mode(decode_reduced(path, target))
+    if image.size == target:
+        return image
+    factor = min(image.size[0] // target[0], image.size[1] // target[1]) // 2
+    if factor > 1:
+        image = image.reduce(factor)
+    return image.resize(target, resample)
+
+# full decode and thumbnail, the way the viewers used to do it
+def open_full(path, size, resample=Image.LANCZOS):
+    image = Image.open(path)
+    image.load()
+    return image.resize(fit_size(image.size, size), resample)
+
+def benchmark(path, size, repeats=5):
+    with Image.open(path) as image:
+        full = image.size
+        target = fit_size(image.size, size)
+    reduced = decode_reduced(path, target)
+    decoded = {"full decode + resize": (full, len(reduced.getbands())),
+               "preview decode": (reduced.size, len(reduced.getbands()))}
+    for name, opener in (("full decode + resize", open_full), ("preview decode", open_preview)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            opener(path, size)
+        seconds = (time.perf_counter() - start) / repeats
+        (w, h), bands = decoded[name]
+        print(f"{name:22} {seconds * 1000:8.1f} ms, decodes {w}x{h} ({w * h * bands / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode an image at preview size")
+    parser.add_argument("image", help="image file")
+    parser.add_argument("--size", type=int, nargs=2, default=(800, 600), metavar=("W", "H"), help="box to fit the preview in (default: 800 600)")
+    parser.add_argument("-o", "--output", help="save the preview to this path instead of showing it")
+    parser.add_argument("--benchmark", action="store_true", help="compare time and memory against a full decode")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.image, tuple(args.size))
+    else:
+        preview = open_preview(args.image, tuple(args.size))
+        if args.output:
+            preview.save(args.output)
+        else:
+            preview.show()
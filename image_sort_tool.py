@@ -1,8 +1,11 @@
 import os
 import sys
-import glob
 import tkinter as tk
-from PIL import Image, ImageTk
+from PIL import ImageTk
+
+from file_ops import FileOps, JOURNAL_NAME, undo_into
+from image_discovery import find_images
+from image_preview import open_preview
 
 # Command line arguments
 search_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
@@ -10,16 +13,15 @@ output_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.getcwd(), 'sa
 recursive = True if len(sys.argv) > 3 and sys.argv[3] == '-r' else False
 
 # Find all image files in the search directory
-if recursive:
-    search_pattern = os.path.join(search_dir, '**', '*.*')
-else:
-    search_pattern = os.path.join(search_dir, '*.*')
-image_files = sorted(glob.glob(search_pattern, recursive=recursive))
+image_files = find_images(search_dir, recursive)
 image_index = 0
 
 # Create the output directory if it does not exist
 os.makedirs(output_dir, exist_ok=True)
 
+# Queue saves and deletes on a background thread
+file_ops = FileOps(os.path.join(output_dir, JOURNAL_NAME))
+
 # Create the main window
 root = tk.Tk()
 root.title('Image Viewer')
@@ -28,9 +30,8 @@ root.title('Image Viewer')
 canvas = tk.Canvas(root, width=800, height=600)
 canvas.pack()
 
-# Load the first image
-current_image = Image.open(image_files[image_index])
-current_image.thumbnail((800, 600))
+# Load the first image, decoded straight at preview size
+current_image = open_preview(image_files[image_index], (800, 600))
 tk_image = ImageTk.PhotoImage(current_image)
 image_item = canvas.create_image(0, 0, anchor='nw', image=tk_image)
 
@@ -38,33 +39,39 @@ image_item = canvas.create_image(0, 0, anchor='nw', image=tk_image)
 def next_image():
     global image_index, current_image, tk_image, image_item
     image_index = (image_index + 1) % len(image_files)
-    current_image = Image.open(image_files[image_index])
-    current_image.thumbnail((800, 600))
+    current_image = open_preview(image_files[image_index], (800, 600))
     tk_image = ImageTk.PhotoImage(current_image)
     canvas.itemconfig(image_item, image=tk_image)
 
 def prev_image():
     global image_index, current_image, tk_image, image_item
     image_index = (image_index - 1) % len(image_files)
-    current_image = Image.open(image_files[image_index])
-    current_image.thumbnail((800, 600))
+    current_image = open_preview(image_files[image_index], (800, 600))
     tk_image = ImageTk.PhotoImage(current_image)
     canvas.itemconfig(image_item, image=tk_image)
 
 def save_image():
-    global image_index, current_image
-    output_file = os.path.join(output_dir, os.path.basename(image_files[image_index]))
-    current_image.save(output_file)
+    # copy the original file, not the downsized preview
+    file_ops.copy(image_files[image_index], output_dir)
     next_image()
 
 def delete_image():
-    global image_index, current_image
-    os.remove(image_files[image_index])
+    global image_index, current_image, tk_image
+    file_ops.delete(image_files[image_index])
     image_files.pop(image_index)
     if image_index >= len(image_files):
         image_index = 0
-    current_image = Image.open(image_files[image_index])
-    current_image.thumbnail((800, 600))
+    current_image = open_preview(image_files[image_index], (800, 600))
+    tk_image = ImageTk.PhotoImage(current_image)
+    canvas.itemconfig(image_item, image=tk_image)
+
+def undo():
+    # a deleted image comes back where the viewer is now
+    undo_into(root, file_ops, image_files, lambda entry: image_index, restore)
+
+def restore(entry):
+    global current_image, tk_image
+    current_image = open_preview(image_files[image_index], (800, 600))
     tk_image = ImageTk.PhotoImage(current_image)
     canvas.itemconfig(image_item, image=tk_image)
 
@@ -81,6 +88,12 @@ save_button = tk.Button(button_frame, text='Save', command=save_image)
 save_button.pack(side='left')
 delete_button = tk.Button(button_frame, text='Delete', command=delete_image)
 delete_button.pack(side='left')
+undo_button = tk.Button(button_frame, text='Undo', command=undo)
+undo_button.pack(side='left')
+root.bind('<Control-z>', lambda event: undo())
 
 # Start the main event loop
 root.mainloop()
+
+# Finish queued saves and deletes before exiting
+file_ops.flush()
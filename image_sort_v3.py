@@ -1,17 +1,37 @@
 import os
+import queue
 import argparse
+import threading
 import tkinter as tk
-from PIL import Image, ImageTk
+from PIL import ImageTk
+
+from contact_sheet import run_contact_sheet
+from file_ops import FileOps, JOURNAL_NAME, undo_into
+from image_discovery import find_images, iter_images
+from image_prefetch import Prefetcher, LatencyLog
+from image_preview import open_preview
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+# open an image shrunk to fit the window, decoding no more pixels than needed
+def load_scaled(image_path, size):
+    return open_preview(image_path, size)
 
 
 class ImageViewer:
-    def __init__(self, search_dir, output_dir, recursive):
+    def __init__(self, search_dir, output_dir, recursive, prefetch=3, latency=False, journal=None):
         self.images = []
         self.current_index = 0
         self.search_dir = search_dir
         self.output_dir = output_dir
         self.recursive = recursive
 
+        self.file_ops = FileOps(journal or os.path.join(output_dir, JOURNAL_NAME))
+
+        # decode the images around the current one in the background
+        self.prefetcher = Prefetcher(load_scaled, radius=prefetch)
+        self.latency = LatencyLog(latency)
+
         # create main window
         self.root = tk.Tk()
         self.root.title("Image Viewer")
@@ -41,69 +61,129 @@ class ImageViewer:
         self.delete_button = tk.Button(self.button_frame, text="Delete", command=self.delete_image)
         self.delete_button.pack(side=tk.LEFT, padx=10, pady=10)
 
-        # search for images
-        self.search_images(self.search_dir)
+        # create undo button
+        self.undo_button = tk.Button(self.button_frame, text="Undo", command=self.undo)
+        self.undo_button.pack(side=tk.LEFT, padx=10, pady=10)
 
-        # display first image
-        self.display_image()
+        # arrow keys step through the images
+        self.root.bind("<Right>", lambda event: self.next_image())
+        self.root.bind("<Left>", lambda event: self.prev_image())
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+        # search for images, the first one is displayed as soon as it is found
+        self.search_images(self.search_dir)
 
         # start main loop
         self.root.mainloop()
 
+        # finish queued saves and deletes before exiting
+        self.file_ops.flush()
+
     def search_images(self, directory):
-        for filename in os.listdir(directory):
-            filepath = os.path.join(directory, filename)
-            if os.path.isdir(filepath):
-                if self.recursive:
-                    self.search_images(filepath)
-            elif filename.endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        # scan on a background thread and hand the results to the Tk thread
+        # through a queue, so large trees do not block the window
+        self.found = queue.Queue()
+        self.scanning = True
+
+        def scan():
+            for filepath in iter_images(directory, self.recursive, IMAGE_EXTENSIONS):
+                self.found.put(filepath)
+            self.found.put(None)
+
+        threading.Thread(target=scan, daemon=True).start()
+        self.root.after(50, self.collect_images)
+
+    def collect_images(self):
+        first = not self.images
+        try:
+            while True:
+                filepath = self.found.get_nowait()
+                if filepath is None:
+                    self.scanning = False
+                    break
                 self.images.append(filepath)
+        except queue.Empty:
+            pass
+        if first and self.images:
+            self.display_image()
+        if self.scanning:
+            self.root.after(50, self.collect_images)
 
     def display_image(self):
-        # load image
-        image_path = self.images[self.current_index]
-        pil_image = Image.open(image_path)
-
-        # scale image to fit window
-        window_width, window_height = self.root.winfo_width(), self.root.winfo_height()
-        image_width, image_height = pil_image.size
-        if image_width > window_width or image_height > window_height:
-            scale_factor = min(window_width / image_width, window_height / image_height)
-            new_size = (int(image_width * scale_factor), int(image_height * scale_factor))
-            pil_image = pil_image.resize(new_size)
+        # load image scaled to fit the window, usually already prefetched
+        window_size = (self.root.winfo_width(), self.root.winfo_height())
+        pil_image, cached = self.prefetcher.get(self.images, self.current_index, window_size)
 
         # update label with new image
         tk_image = ImageTk.PhotoImage(pil_image)
         self.image_label.config(image=tk_image)
         self.image_label.image = tk_image
+        if self.latency.enabled:
+            self.root.update_idletasks()
+            self.latency.stop("(prefetched)" if cached else "(decoded)")
 
     def next_image(self):
+        if not self.images:
+            return
+        self.latency.start("next")
         self.current_index = (self.current_index + 1) % len(self.images)
         self.display_image()
 
     def prev_image(self):
+        if not self.images:
+            return
+        self.latency.start("previous")
         self.current_index = (self.current_index - 1) % len(self.images)
         self.display_image()
 
     def save_image(self):
-        image_path = self.images[self.current_index]
-        output_path = os.path.join(self.output_dir, os.path.basename(image_path))
-        os.makedirs(self.output_dir, exist_ok=True)
-        with open(output_path, 'wb') as f:
-            with open(image_path, 'rb') as g:
-                f.write(g.read())
+        if not self.images:
+            return
+        self.file_ops.copy(self.images[self.current_index], self.output_dir)
         self.next_image()
 
     def delete_image(self):
+        if not self.images:
+            return
+        self.latency.start("delete")
         image_path = self.images[self.current_index]
-        os.remove(image_path)
+        self.file_ops.delete(image_path)
         self.images.remove(image_path)
+        self.prefetcher.discard(image_path)
+        if not self.images:
+            self.image_label.config(image='')
+            return
         self.current_index = self.current_index % len(self.images)
         self.display_image()
 
+    def undo(self):
+        # a deleted image comes back where the viewer is now
+        undo_into(self.root, self.file_ops, self.images, lambda entry: self.current_index, self.restore)
+
+    def restore(self, entry):
+        # an undone save goes back to the image it copied
+        if entry["op"] == "copy" and entry["src"] in map(os.path.abspath, self.images):
+            self.current_index = [os.path.abspath(p) for p in self.images].index(entry["src"])
+        self.display_image()
+
+    def close(self):
+        self.prefetcher.close()
+        self.latency.report()
+        self.root.destroy()
+
 if __name__ == '__main__':
-        parser = argparse.ArgumentParser(description='Recursively search a directory for images and display them in a window')
-        parser.add_argument('search_dir', nargs='?', default='.', help='Search directory (default: current directory)')
-        parser.add_argument('-o', '--output-dir', default='saved', help='Output directory for saved images (default: "saved" subdirectory in current directory)')
-        parser.add_argument('-r', '--recursive', action='store_true', help='Recursively search subdirectories for images')
-        args = parser.parse_args()
+    parser = argparse.ArgumentParser(description='Recursively search a directory for images and display them in a window')
+    parser.add_argument('search_dir', nargs='?', default='.', help='Search directory (default: current directory)')
+    parser.add_argument('-o', '--output-dir', default='saved', help='Output directory for saved images (default: "saved" subdirectory in current directory)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Recursively search subdirectories for images')
+    parser.add_argument('--prefetch', type=int, default=3, help='Images to decode ahead in each direction (default: 3)')
+    parser.add_argument('--latency', action='store_true', help='Print how long each keypress takes to show its image')
+    parser.add_argument('--grid', action='store_true', help='Show a scrollable grid of thumbnails with multi-select instead of one image at a time')
+    parser.add_argument('--journal', help=f'Undo journal of saves and deletes (default: {JOURNAL_NAME} in the output directory)')
+    args = parser.parse_args()
+
+    if args.grid:
+        run_contact_sheet(find_images(args.search_dir, args.recursive, IMAGE_EXTENSIONS), args.output_dir, "copy", title="Image Viewer", journal=args.journal)
+    else:
+        viewer = ImageViewer(args.search_dir, args.output_dir, args.recursive, args.prefetch, args.latency, args.journal)
@@ -1,10 +1,18 @@
 import os
-import glob
 import tkinter as tk
-from PIL import Image, ImageTk
+from PIL import ImageTk
+
+from file_ops import FileOps, JOURNAL_NAME, undo_into
+from image_discovery import find_images
+from image_prefetch import Prefetcher, LatencyLog
+from image_preview import open_preview
+
+# open an image scaled to fit a (width, height) box, decoding no more pixels than needed
+def load_fitted(file_path, size):
+    return open_preview(file_path, size, upscale=True)
 
 class ImageViewer:
-    def __init__(self, search_dir, output_dir, recursive):
+    def __init__(self, search_dir, output_dir, recursive, prefetch=3, latency=False, journal=None):
         self.photo = None
         self.image_width = 800
         self.image_height = 600
@@ -13,6 +21,9 @@ class ImageViewer:
         self.search_dir = search_dir
         self.output_dir = output_dir
         self.recursive = recursive
+        self.prefetcher = Prefetcher(load_fitted, radius=prefetch)
+        self.latency = LatencyLog(latency)
+        self.file_ops = FileOps(journal or os.path.join(output_dir, JOURNAL_NAME))
 
         self.window = tk.Tk()
         self.window.title("Image Viewer")
@@ -32,54 +43,76 @@ class ImageViewer:
         self.delete_button = tk.Button(self.window, text="Delete", command=self.delete_image)
         self.delete_button.pack(side=tk.LEFT)
 
+        self.undo_button = tk.Button(self.window, text="Undo", command=self.undo)
+        self.undo_button.pack(side=tk.LEFT)
+
+        self.window.bind("<Right>", lambda event: self.show_next_image())
+        self.window.bind("<Left>", lambda event: self.show_previous_image())
+        self.window.bind("<Control-z>", lambda event: self.undo())
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
         self.load_images()
         self.show_image()
 
         self.window.mainloop()
+        self.file_ops.flush()
 
     def load_images(self):
-        search_path = os.path.join(self.search_dir, "**/*.jpg" if self.recursive else "*.jpg")
-        for file_path in glob.glob(search_path, recursive=self.recursive):
-            self.image_list.append(file_path)
+        self.image_list = find_images(self.search_dir, self.recursive)
 
     def show_image(self):
         self.canvas.delete("all")
         file_path = self.image_list[self.current_index]
-        image = Image.open(file_path)
-        image_width, image_height = image.size
-        scale = min(self.image_width / image_width, self.image_height / image_height)
-        new_width = int(image_width * scale)
-        new_height = int(image_height * scale)
-        image = image.resize((new_width, new_height), Image.ANTIALIAS)
+        image, cached = self.prefetcher.get(self.image_list, self.current_index, (self.image_width, self.image_height))
+        new_width, new_height = image.size
         self.photo = ImageTk.PhotoImage(image)
         self.canvas.create_image((self.image_width - new_width) // 2, (self.image_height - new_height) // 2, image=self.photo, anchor=tk.NW)
         self.window.title(f"Image Viewer - {file_path}")
+        if self.latency.enabled:
+            self.window.update_idletasks()
+            self.latency.stop("(prefetched)" if cached else "(decoded)")
 
 
     def show_next_image(self):
+        self.latency.start("next")
         self.current_index = (self.current_index + 1) % len(self.image_list)
         self.show_image()
 
     def show_previous_image(self):
+        self.latency.start("previous")
         self.current_index = (self.current_index - 1) % len(self.image_list)
         self.show_image()
 
+    # saving moves the image into the output directory
     def save_image(self):
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
         file_path = self.image_list[self.current_index]
-        output_file = os.path.join(self.output_dir, os.path.basename(file_path))
-        shutil.copyfile(file_path, output_file)
-        self.delete_image()
+        self.file_ops.move(file_path, self.output_dir)
+        self.remove_current()
 
     def delete_image(self):
         file_path = self.image_list[self.current_index]
-        os.remove(file_path)
-        self.image_list.pop(self.current_index)
+        self.file_ops.delete(file_path)
+        self.remove_current()
+
+    def remove_current(self):
+        file_path = self.image_list.pop(self.current_index)
+        self.prefetcher.discard(file_path)
         if self.current_index >= len(self.image_list):
             self.current_index = 0
+        if not self.image_list:
+            self.canvas.delete("all")
+            return
         self.show_image()
 
+    def undo(self):
+        undo_into(self.window, self.file_ops, self.image_list, lambda entry: self.current_index,
+                  lambda entry: self.show_image())
+
+    def close(self):
+        self.prefetcher.close()
+        self.latency.report()
+        self.window.destroy()
+
 if __name__ == "__main__":
     import argparse
 
@@ -87,6 +120,9 @@ if __name__ == "__main__":
     parser.add_argument('search_dir', type=str, help='The directory to search for images')
     parser.add_argument('output_dir', type=str, help='The directory to save images')
     parser.add_argument('--recursive', action='store_true', help='Recursively search for images')
+    parser.add_argument('--prefetch', type=int, default=3, help='Images to decode ahead in each direction')
+    parser.add_argument('--latency', action='store_true', help='Print how long each keypress takes to show its image')
+    parser.add_argument('--journal', help='Undo journal of saves and deletes (default: in the output directory)')
     args = parser.parse_args()
 
-    viewer = ImageViewer(args.search_dir, args.output_dir, args.recursive)
+    viewer = ImageViewer(args.search_dir, args.output_dir, args.recursive, args.prefetch, args.latency, args.journal)
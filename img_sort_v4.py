@@ -1,6 +1,64 @@
 import argparse
+import json
 import os
+import time
 import cv2
+import numpy as np
+
+from contact_sheet import run_contact_sheet
+from file_ops import FileOps, JOURNAL_NAME
+from image_discovery import snapshot_images
+from image_preview import open_preview
+
+SESSION_NAME = '.pyimgsort-session.json'
+
+# save every this many actions, and on quit
+SESSION_SAVE_INTERVAL = 25
+
+# load the session of search_dir, bringing its file list up to date by listing
+# only the directories whose mtime changed; returns (img_files, dirs, idx, decisions)
+def load_session(session_path, search_dir, img_exts):
+    search_dir = os.path.abspath(search_dir)
+    previous, current, idx, decisions = {}, None, 0, {}
+    if session_path and os.path.exists(session_path):
+        try:
+            with open(session_path) as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            session = {}
+        if session.get('search_dir') == search_dir and session.get('extensions') == list(img_exts):
+            previous = session['dirs']
+            current, idx, decisions = session['current'], session['index'], session['decisions']
+
+    start = time.perf_counter()
+    img_files, dirs = snapshot_images(search_dir, img_exts, previous)
+    listed = sum(1 for d, entry in dirs.items() if previous.get(d) is not entry)
+    if previous:
+        print(f'Resumed session: {len(img_files)} images, {listed} of {len(dirs)} directories changed, '
+              f'rescanned in {time.perf_counter() - start:.2f} s')
+
+    # pick up at the image we were on, or as close to its position as possible
+    if current in img_files:
+        idx = img_files.index(current)
+    idx = min(idx, max(len(img_files) - 1, 0))
+    return img_files, dirs, idx, decisions
+
+# write the session to a temporary file and rename it over the old one, so
+# an interrupted save never leaves a broken session behind
+def save_session(session_path, search_dir, img_exts, dirs, img_files, idx, decisions):
+    session = {
+        'search_dir': os.path.abspath(search_dir),
+        'extensions': list(img_exts),
+        'dirs': dirs,
+        'current': img_files[idx] if img_files else None,
+        'index': idx,
+        'decisions': decisions,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(session_path)), exist_ok=True)
+    tmp_path = session_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(session, f)
+    os.replace(tmp_path, session_path)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -16,49 +74,85 @@ s: save current image to output_dir
 d: delete current image from search_dir
 n: display the next image
 p: display the previous image
+u: undo the last save or delete
 q: quit program
+
+Saves and deletes run in the background and are written to a journal
+(.sort-journal.jsonl in output_dir), see file_ops.py to replay or roll back.
+Deleted images wait in .trash folders until file_ops.py --empty-trash.
+
+The file list, the current image and the decisions so far are kept in a
+session file (.pyimgsort-session.json in output_dir). Reopening the same
+search_dir resumes where you left off and only lists directories again
+whose modification time changed.
+
+With --grid the images are shown as a scrollable contact sheet instead;
+click, ctrl-click and shift-click select, s and d act on the selection.
 '''
 )
     parser.add_argument('search_dir', type=str, help='the directory to search for images')
     parser.add_argument('output_dir', type=str, help='the directory to save images')
+    parser.add_argument('--grid', action='store_true', help='cull in a grid of thumbnails with multi-select')
+    parser.add_argument('--journal', type=str, help='undo journal of saves and deletes (default: in output_dir)')
+    parser.add_argument('--session', type=str, help='session file to resume from and save to (default: in output_dir)')
+    parser.add_argument('--restart', action='store_true', help='ignore the saved session and start from the first image')
     args = parser.parse_args()
+    journal = args.journal or os.path.join(args.output_dir, JOURNAL_NAME)
+    session_path = args.session or os.path.join(args.output_dir, SESSION_NAME)
 
-    # Get a list of image files in the search directory
+    # Get a list of image files in the search directory, reusing the listings
+    # of the last session for directories that did not change
     img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
-    img_files = []
-    for root, dirs, files in os.walk(args.search_dir):
-        for file in files:
-            if file.lower().endswith(img_exts):
-                img_files.append(os.path.join(root, file))
+    img_files, dirs, idx, decisions = load_session(None if args.restart else session_path, args.search_dir, img_exts)
+
+    if args.grid:
+        run_contact_sheet(img_files, args.output_dir, 'move', title='PyImgSort', journal=journal)
+        return
+    file_ops = FileOps(journal)
 
     # Display images and allow save/delete options
-    idx = 0
-    while True:
-        img = cv2.imread(img_files[idx])
-        img_h, img_w, _ = img.shape
-        scale = min(800/img_w, 600/img_h)
-        img = cv2.resize(img, (int(scale*img_w), int(scale*img_h)))
+    actions = 0
+    while img_files:
+        # decode at preview size instead of full resolution
+        img = open_preview(img_files[idx], (800, 600), upscale=True).convert('RGB')
+        img = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
         cv2.imshow('Image Viewer', img)
         key = cv2.waitKey(0)
 
         if key == ord('q'):
             break
         elif key == ord('s'):
-            os.rename(img_files[idx], os.path.join(args.output_dir, os.path.basename(img_files[idx])))
+            file_ops.move(img_files[idx], args.output_dir)
+            decisions[img_files[idx]] = 'saved'
             del img_files[idx]
             if idx >= len(img_files):
                 idx = 0
         elif key == ord('d'):
-            os.remove(img_files[idx])
+            file_ops.delete(img_files[idx])
+            decisions[img_files[idx]] = 'deleted'
             del img_files[idx]
             if idx >= len(img_files):
                 idx = 0
+        elif key == ord('u'):
+            future = file_ops.undo()
+            # wait for the file to be back before showing it again; a failed
+            # undo was reported by file_ops and leaves the list as it is
+            if future is not None and future.exception() is None:
+                entry = future.result()
+                img_files.insert(idx, entry['src'])
+                decisions.pop(entry['src'], None)
         elif key == ord('n'):
             idx = (idx + 1) % len(img_files)
         elif key == ord('p'):
             idx = (idx - 1) % len(img_files)
 
+        actions += 1
+        if actions % SESSION_SAVE_INTERVAL == 0:
+            save_session(session_path, args.search_dir, img_exts, dirs, img_files, idx, decisions)
+
     cv2.destroyAllWindows()
+    file_ops.flush()
+    save_session(session_path, args.search_dir, img_exts, dirs, img_files, idx, decisions)
 
 if __name__ == '__main__':
     main()
@@ -6,8 +6,18 @@ Version: 0.2a
 License: Open source
 
 Usage:
-    Run the script and follow the prompts to specify the image dimensions, dot size, dot spacing, and dot pattern.
-    You can either enter the values manually or choose a preset resolution and aspect ratio.
+    Run the script without arguments and follow the prompts to specify the image dimensions, dot size, dot spacing,
+    and dot pattern. You can either enter the values manually or choose a preset resolution and aspect ratio.
+
+    Or pass everything on the command line, without displaying the result:
+        python make_dotgrid.py --preset 4k_h --radius 2 --spacing 8 --pattern random --seed 1
+
+    Or render a whole manifest (JSON list or CSV with width, height, radius, spacing, pattern, seed columns) on a
+    process pool. Entries whose output file already exists with the same parameters are skipped:
+        python make_dotgrid.py --manifest variants.csv --output-dir out --workers 8
+
+    Or stream a huge canvas strip by strip into a 1-bit PNG or TIFF (add --wrap for a seamless tile):
+        python make_dotgrid.py --width 30000 --height 20000 --pattern random --spacing 12 --stream --bits 1 -o big.tif
     
 Arguments:
     - image_width: the width of the image in pixels (integer).
@@ -22,19 +32,35 @@ Returns:
     The function creates a black and white image with dots arranged in a grid or randomly scattered,
     based on the specified dimensions, dot size, dot spacing, and dot pattern.
     The image is displayed on the screen and saved to a file named "dotted_image_[width]x[height]_[radius]_[spacing]_[pattern].png",
-    where [width], [height], [radius], [spacing], and [pattern] are replaced with the corresponding values specified by the user.
+    where [width], [height], [radius], [spacing], and [pattern] are replaced with the corresponding values specified by the user
+    (with "_[seed]" appended when a seed is given). The parameters are stored in a PNG text chunk of the file.
 
 Functions:
     - generate_poisson_disc_samples: generates points randomly distributed with a minimum distance between them,
-      using Poisson disc sampling algorithm.
+      using Bridson's Poisson disc sampling algorithm, as an (N, 2) NumPy array.
+    - benchmark_poisson_disc_samples: times the sampler at the hd, 2k and 4k presets ("--benchmark").
+    - rasterize_grid / rasterize_dots: stamp a precomputed (optionally supersampled, anti-aliased) dot kernel
+      into a NumPy coverage array, with strided assignment for grids and scatter-add for random samples.
     - create_dotted_image: creates a black and white image with dots arranged in a grid or randomly scattered,
       based on the specified dimensions, dot size, dot spacing, and dot pattern.
+    - run_batch: renders the entries of a manifest (see load_manifest) on a process pool.
+    - stream_dotted_image: renders huge canvases in horizontal strips straight into a 1 or 8 bit PNG or TIFF,
+      with bounded memory, optionally wrapping the samples so the result tiles seamlessly.
 """
 
 import sys
-from PIL import Image, ImageDraw
+import os
+import csv
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image, ImageDraw, PngImagePlugin
+import functools
 import math
-import random
+import struct
+import time
+import zlib
+import numpy as np
 
 size_preset_list = {
     "hd": (1920, 1080),
@@ -47,78 +73,591 @@ aspect_preset_list = {
     "s": (1, 1)
     }    
 
-def generate_poisson_disc_samples(width, height, min_dist, max_attempts=30):
-    # Set up grid
+# PNG text chunk holding the parameters an image was rendered with
+PARAMS_KEY = "dotgrid-params"
+
+def generate_poisson_disc_samples(width, height, min_dist, max_attempts=30, seed=None, batch_size=4096,
+                                  attempts_per_pass=4, fixed=None, wrap_x=False, wrap_y=False):
+    """Bridson's algorithm, run on batches of active samples at once.
+
+    fixed is an optional (M, 2) array of existing points (which may lie up to
+    min_dist outside the canvas) that new samples keep their distance from and
+    grow out of; they are not returned. wrap_x / wrap_y measure distances
+    toroidally so the samples tile seamlessly. seed may also be a NumPy
+    Generator.
+
+    Returns an (N, 2) float array of x, y positions.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Set up grid: each cell holds the index of at most one sample, 0 when empty.
+    # Index 0 is a sentinel sample at infinity, so empty cells never count as
+    # too close. The grid is padded by two cells on every side so the 5x5
+    # neighbourhood of any cell can be gathered without bounds checks, and so
+    # fixed points and wrapped copies just outside the canvas have a place.
     cell_size = min_dist / math.sqrt(2)
     grid_width = math.ceil(width / cell_size)
     grid_height = math.ceil(height / cell_size)
-    grid = [[None] * grid_width for _ in range(grid_height)]
+    grid = np.zeros((grid_height + 4, grid_width + 4), dtype=np.int64)
+    rank_grid = np.zeros_like(grid)
+    min_dist_sq = min_dist * min_dist
+
+    # Flat offsets of the 5x5 neighbourhood without its corners, which are too
+    # far away to ever hold a sample within min_dist
+    stride = grid.shape[1]
+    offsets = np.array([dy * stride + dx for dy in range(-2, 3) for dx in range(-2, 3)
+                        if abs(dy) + abs(dx) < 4])
+
+    def cells_of(points):
+        return np.floor(points / cell_size).astype(np.int64)
+
+    def in_grid(cells):
+        return ((cells[:, 0] >= -2) & (cells[:, 0] < grid_width + 2)
+                & (cells[:, 1] >= -2) & (cells[:, 1] < grid_height + 2))
+
+    def neighbourhood(lookup, cells):
+        return lookup.ravel()[((cells[:, 1] + 2) * stride + cells[:, 0] + 2)[:, None] + offsets]
 
-    # Generate first sample
-    samples = []
-    first_sample = (random.uniform(0, width), random.uniform(0, height))
-    samples.append(first_sample)
-    grid[int(first_sample[1] / cell_size)][int(first_sample[0] / cell_size)] = first_sample
+    def wrapped_copies(points):
+        # Copies of points near an edge shifted across the canvas, and the index
+        # of the point each copy came from
+        shifts = [(dx, dy) for dx in ((-width, 0, width) if wrap_x else (0,))
+                  for dy in ((-height, 0, height) if wrap_y else (0,)) if (dx, dy) != (0, 0)]
+        copies, origins = [np.empty((0, 2))], [np.empty(0, dtype=np.int64)]
+        for dx, dy in shifts:
+            moved = points + (dx, dy)
+            near = ((moved[:, 0] > -min_dist) & (moved[:, 0] < width + min_dist)
+                    & (moved[:, 1] > -min_dist) & (moved[:, 1] < height + min_dist))
+            copies.append(moved[near])
+            origins.append(np.flatnonzero(near))
+        return np.concatenate(copies), np.concatenate(origins)
+
+    # Samples live in a preallocated array that grows by doubling. Fixed points
+    # and wrapped copies are stored too but flagged as not real.
+    samples = np.empty((1024, 2), dtype=np.float64)
+    real = np.zeros(1024, dtype=bool)
+    samples[0] = np.inf
+    count = 1
+
+    def store(points, is_real):
+        nonlocal samples, real, count
+        cells = cells_of(points)
+        keep = in_grid(cells)
+        points, cells = points[keep], cells[keep]
+        k = len(points)
+        while count + k > len(samples):
+            samples = np.concatenate((samples, np.empty_like(samples)))
+            real = np.concatenate((real, np.zeros_like(real)))
+        indices = np.arange(count, count + k)
+        samples[indices] = points
+        real[indices] = is_real
+        grid[cells[:, 1] + 2, cells[:, 0] + 2] = indices
+        count += k
+        return indices
+
+    # Start from the fixed points, or from one random sample
+    if fixed is not None and len(fixed):
+        fixed = np.asarray(fixed, dtype=np.float64).reshape(-1, 2)
+        active_samples = store(fixed, False)
+        store(wrapped_copies(fixed)[0], False)
+    else:
+        first = np.array([[rng.uniform(0, width), rng.uniform(0, height)]])
+        active_samples = store(first, True)
+        store(wrapped_copies(first)[0], False)
 
     # Generate additional samples using Poisson disc sampling
-    active_samples = [first_sample]
-    while active_samples:
-        sample = random.choice(active_samples)
-        found_valid_sample = False
-
-        for i in range(max_attempts):
-            angle = random.uniform(0, math.pi * 2)
-            radius = random.uniform(min_dist, min_dist * 2)
-            new_sample = (sample[0] + radius * math.cos(angle), sample[1] + radius * math.sin(angle))
-
-            # Check if the new sample is within bounds
-            if not (0 <= new_sample[0] < width and 0 <= new_sample[1] < height):
-                continue
+    while len(active_samples):
+        # Take a random batch of samples off the active list
+        n = min(batch_size, len(active_samples))
+        if n < len(active_samples):
+            pick = rng.choice(len(active_samples), size=n, replace=False)
+            rest = np.ones(len(active_samples), dtype=bool)
+            rest[pick] = False
+            batch, active_samples = active_samples[pick], active_samples[rest]
+        else:
+            batch, active_samples = active_samples, active_samples[:0]
+
+        # Generate candidates around every sample in the batch a few attempts at
+        # a time; samples that found a valid candidate stop early like the
+        # sequential algorithm does, the rest try again until max_attempts
+        new_samples = np.empty((n, 2))
+        found = np.zeros(n, dtype=bool)
+        searching = np.arange(n)
+        for attempt in range(0, max_attempts, attempts_per_pass):
+            k = min(attempts_per_pass, max_attempts - attempt)
+            angle = rng.uniform(0, math.pi * 2, (len(searching), k))
+            radius = rng.uniform(min_dist, min_dist * 2, (len(searching), k))
+            origin = samples[batch[searching]]
+            candidates = np.stack((origin[:, 0, None] + radius * np.cos(angle),
+                                   origin[:, 1, None] + radius * np.sin(angle)), axis=-1).reshape(-1, 2)
+            valid = ((candidates[:, 0] >= 0) & (candidates[:, 0] < width)
+                     & (candidates[:, 1] >= 0) & (candidates[:, 1] < height))
+
+            # Reject candidates whose own cell is taken, then candidates that are
+            # too close to any existing sample in the surrounding cells
+            cells = cells_of(np.where(valid[:, None], candidates, 0))
+            valid &= grid[cells[:, 1] + 2, cells[:, 0] + 2] == 0
+            check = np.flatnonzero(valid)
+            neighbours = neighbourhood(grid, cells[check])
+            dx = samples[:, 0][neighbours] - candidates[check, 0, None]
+            dy = samples[:, 1][neighbours] - candidates[check, 1, None]
+            valid[check] = (dx * dx + dy * dy >= min_dist_sq).all(axis=1)
+            valid = valid.reshape(len(searching), k)
 
-            # Check if the new sample is too close to any existing samples
-            cell_x, cell_y = int(new_sample[0] / cell_size), int(new_sample[1] / cell_size)
-            search_radius = min_dist / math.sqrt(2)
-            for j in range(max(0, cell_x - 2), min(grid_width, cell_x + 3)):
-                for k in range(max(0, cell_y - 2), min(grid_height, cell_y + 3)):
-                    existing_sample = grid[k][j]
-                    if existing_sample and math.dist(existing_sample, new_sample) < min_dist:
-                        break
-                else:
-                    continue
+            # Keep the first valid candidate of each sample
+            hit = valid.any(axis=1)
+            first = np.flatnonzero(hit) * k + valid.argmax(axis=1)[hit]
+            new_samples[searching[hit]] = candidates[first]
+            found[searching[hit]] = True
+            searching = searching[~hit]
+            if len(searching) == 0:
                 break
+
+        # Samples without a valid candidate are exhausted and dropped
+        active_samples = np.concatenate((active_samples, batch[found]))
+        new_samples = new_samples[found]
+        m = len(new_samples)
+        if m == 0:
+            continue
+
+        # Candidates from the same batch can still be too close to each other
+        # (directly or through a wrapped copy): give each a random rank and keep
+        # it only if no lower ranked candidate lies within min_dist. The rank
+        # grid stores rank * entries + entry, so the minimum per cell is the
+        # lowest ranked entry and both can be decoded from it.
+        copies, copy_origins = wrapped_copies(new_samples)
+        entries = np.concatenate((new_samples, copies))
+        entry_origin = np.concatenate((np.arange(m), copy_origins))
+        entry_cells = cells_of(entries)
+        keep_entry = in_grid(entry_cells)
+        entries, entry_origin, entry_cells = entries[keep_entry], entry_origin[keep_entry], entry_cells[keep_entry]
+        rank = rng.permutation(m) + 1
+        e = len(entries)
+        codes = rank[entry_origin] * e + np.arange(e)
+        rows, cols = entry_cells[:, 1] + 2, entry_cells[:, 0] + 2
+        rank_grid[rows, cols] = (m + 1) * e
+        np.minimum.at(rank_grid, (rows, cols), codes)
+        neighbour_codes = neighbourhood(rank_grid, entry_cells[:m])
+        rank_grid[rows, cols] = 0
+        occupied = neighbour_codes > 0
+        neighbour_rank = np.where(occupied, neighbour_codes // e, m + 1)
+        neighbour_pos = entries[np.where(occupied, neighbour_codes % e, 0)]
+        dx = neighbour_pos[..., 0] - new_samples[:, 0, None]
+        dy = neighbour_pos[..., 1] - new_samples[:, 1, None]
+        conflict = (dx * dx + dy * dy < min_dist_sq) & (neighbour_rank < rank[:, None])
+        new_samples = new_samples[~conflict.any(axis=1)]
+
+        # Store the accepted samples and make them active
+        active_samples = np.concatenate((active_samples, store(new_samples, True)))
+        store(wrapped_copies(new_samples)[0], False)
+
+    return samples[:count][real[:count]].copy()
+
+def benchmark_poisson_disc_samples(min_dist=4, max_attempts=30):
+    for name, (width, height) in size_preset_list.items():
+        start = time.perf_counter()
+        samples = generate_poisson_disc_samples(width, height, min_dist, max_attempts, seed=0)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>3} {width}x{height} spacing {min_dist}: {len(samples)} samples in {elapsed:.2f} s ({len(samples) / elapsed:,.0f} samples/s)")
+
+@functools.lru_cache(maxsize=None)
+def dot_kernel(box_width, box_height, supersample=1, phase_x=0, phase_y=0):
+    """Coverage (0..1) of one dot, as drawn by ImageDraw.ellipse.
+
+    The ellipse is drawn with the integer bounding box (0, 0, box_width, box_height)
+    at supersampled resolution, shifted by the sub-pixel phase, and box-filtered
+    back down to output pixels. At supersample 1 this is exactly the mask
+    ImageDraw produces, so stamped dots match the ImageDraw backend pixel for pixel.
+    """
+    size_x = -(-(phase_x + box_width + 1) // supersample) * supersample
+    size_y = -(-(phase_y + box_height + 1) // supersample) * supersample
+    mask = Image.new('L', (size_x, size_y), 0)
+    ImageDraw.Draw(mask).ellipse((phase_x, phase_y, phase_x + box_width, phase_y + box_height), fill=255)
+    mask = np.asarray(mask, dtype=np.float32) / 255
+    return mask.reshape(size_y // supersample, supersample, size_x // supersample, supersample).mean(axis=(1, 3))
+
+def _dot_boxes(centers, dot_radius, supersample):
+    # ImageDraw truncates the bounding box coordinates towards zero
+    scaled = np.asarray(centers, dtype=np.float64).reshape(-1, 2) * supersample
+    radius = dot_radius * supersample
+    x0 = np.trunc(scaled[:, 0] - radius).astype(np.int64)
+    y0 = np.trunc(scaled[:, 1] - radius).astype(np.int64)
+    x1 = np.trunc(scaled[:, 0] + radius).astype(np.int64)
+    y1 = np.trunc(scaled[:, 1] + radius).astype(np.int64)
+    return x0, y0, x1 - x0, y1 - y0
+
+def rasterize_dots(width, height, centers, dot_radius, supersample=1, top=0):
+    """Scatter-add dot kernels for arbitrary centers into a (height, width) coverage array.
+
+    The array covers canvas rows top to top + height; centers are in canvas
+    coordinates and may lie outside the array.
+    """
+    pad = 2 * math.ceil(dot_radius) + 3
+    coverage = np.zeros((height + 2 * pad, width + 2 * pad), dtype=np.float32)
+    if len(centers) == 0:
+        return coverage[pad:pad + height, pad:pad + width]
+    x0, y0, box_w, box_h = _dot_boxes(centers, dot_radius, supersample)
+    y0 -= top * supersample
+
+    # Dots sharing a kernel (same box size and sub-pixel phase) are stamped
+    # together, and all stamps are summed in a single scatter-add
+    phase_x, phase_y = x0 % supersample, y0 % supersample
+    key_base = max(int(box_w.max()), int(box_h.max())) + 1
+    keys = ((box_w * key_base + box_h) * supersample + phase_x) * supersample + phase_y
+    _, first, groups = np.unique(keys, return_index=True, return_inverse=True)
+    stride = coverage.shape[1]
+    indices, weights = [], []
+    for group, member in enumerate(first):
+        members = np.flatnonzero(groups == group)
+        kernel = dot_kernel(int(box_w[member]), int(box_h[member]), supersample,
+                            int(phase_x[member]), int(phase_y[member]))
+        gx, gy = x0[members] // supersample + pad, y0[members] // supersample + pad
+        inside = ((gx >= 0) & (gy >= 0) & (gx + kernel.shape[1] <= stride)
+                  & (gy + kernel.shape[0] <= coverage.shape[0]))
+        members = members[inside]
+        origin = gy[inside] * stride + gx[inside]
+        ky, kx = np.nonzero(kernel)
+        indices.append((origin[:, None] + (ky * stride + kx)[None, :]).ravel())
+        weights.append(np.broadcast_to(kernel[ky, kx], (len(members), len(ky))).ravel())
+    coverage += np.bincount(np.concatenate(indices), np.concatenate(weights),
+                            minlength=coverage.size).reshape(coverage.shape).astype(np.float32)
+    np.clip(coverage, 0, 1, out=coverage)
+    return coverage[pad:pad + height, pad:pad + width]
+
+def rasterize_grid(width, height, dot_radius, dot_spacing, supersample=1, top=0, canvas_height=None):
+    """Stamp one dot kernel over a regular grid with strided slice assignment.
+
+    The array covers rows top to top + height of a canvas_height tall pattern
+    (by default the array is the whole canvas).
+    """
+    canvas_height = canvas_height or top + height
+    pad = 2 * math.ceil(dot_radius) + 3
+    start = int(dot_spacing / 2)
+    count_x = len(range(start, width, dot_spacing))
+    dot_rows = [y for y in range(start, canvas_height, dot_spacing) if top - dot_radius - 1 <= y <= top + height + dot_radius]
+    count_y = len(dot_rows)
+    coverage = np.zeros((height + 2 * pad, width + 2 * pad), dtype=np.float32)
+    if count_x == 0 or count_y == 0:
+        return coverage[pad:pad + height, pad:pad + width]
+
+    # Every grid dot has an integer center, so they all share one kernel
+    x0, y0, box_w, box_h = _dot_boxes([(start, dot_rows[0])], dot_radius, supersample)
+    kernel = dot_kernel(int(box_w[0]), int(box_h[0]), supersample,
+                        int(x0[0] % supersample), int(y0[0] % supersample))
+    origin_x = int(x0[0] // supersample) + pad
+    origin_y = int(y0[0] // supersample) - top + pad
+    for ky, kx in zip(*np.nonzero(kernel)):
+        rows = slice(origin_y + ky, origin_y + ky + count_y * dot_spacing, dot_spacing)
+        cols = slice(origin_x + kx, origin_x + kx + count_x * dot_spacing, dot_spacing)
+        target = coverage[rows, cols]
+        np.maximum(target, kernel[ky, kx], out=target)
+    return coverage[pad:pad + height, pad:pad + width]
+
+def wrapped_centers(centers, width, height, reach, wrap_y=True):
+    """Centers plus copies shifted across the canvas for dots within reach of an edge."""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    copies = [centers]
+    for dx in (-width, 0, width):
+        for dy in ((-height, 0, height) if wrap_y else (0,)):
+            if (dx, dy) == (0, 0):
+                continue
+            moved = centers + (dx, dy)
+            near = ((moved[:, 0] > -reach) & (moved[:, 0] < width + reach)
+                    & (moved[:, 1] > -reach) & (moved[:, 1] < height + reach))
+            copies.append(moved[near])
+    return np.concatenate(copies)
+
+def coverage_to_pixels(coverage):
+    """8-bit grayscale pixels, black dots on white."""
+    return np.rint((1 - coverage) * 255).astype(np.uint8)
+
+def coverage_to_image(coverage):
+    """Black dots on white, converted through Image.fromarray once."""
+    return Image.fromarray(coverage_to_pixels(coverage), 'L').convert('RGB')
+
+class PngStripWriter:
+    """Writes a grayscale (1 or 8 bit) PNG incrementally, one IDAT chunk per strip."""
+
+    def __init__(self, path, width, height, bits=8):
+        self.width, self.height, self.bits = width, height, bits
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(6)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bits, 0, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def write(self, pixels):
+        if self.bits == 1:
+            pixels = np.packbits(pixels >= 128, axis=1)
+        # Every scanline starts with filter type 0 (none)
+        rows = np.hstack((np.zeros((len(pixels), 1), dtype=np.uint8), pixels))
+        data = self.compressor.compress(rows.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+class TiffStripWriter:
+    """Writes an uncompressed grayscale (1 or 8 bit) TIFF incrementally, one TIFF strip per strip.
+
+    The strip data is written first and the directory at the end, so nothing
+    has to be held back; the header is patched to point at the directory on close.
+    """
+
+    def __init__(self, path, width, height, bits=8):
+        self.width, self.height, self.bits = width, height, bits
+        self.file = open(path, 'wb')
+        self.file.write(b'II*\x00' + struct.pack('<I', 0))
+        self.offsets, self.counts = [], []
+        self.rows_per_strip = None
+
+    def write(self, pixels):
+        if self.bits == 1:
+            pixels = np.packbits(pixels >= 128, axis=1)
+        if self.rows_per_strip is None:
+            self.rows_per_strip = len(pixels)
+        data = np.ascontiguousarray(pixels).tobytes()
+        self.offsets.append(self.file.tell())
+        self.counts.append(len(data))
+        self.file.write(data)
+
+    def close(self):
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+        arrays = {}
+        for tag, values in ((273, self.offsets), (279, self.counts)):
+            if len(values) > 1:
+                arrays[tag] = self.file.tell()
+                self.file.write(struct.pack(f'<{len(values)}I', *values))
+        entries = [
+            (256, 4, 1, self.width),
+            (257, 4, 1, self.height),
+            (258, 3, 1, self.bits),
+            (259, 3, 1, 1),  # no compression
+            (262, 3, 1, 1),  # black is zero
+            (273, 4, len(self.offsets), arrays.get(273, self.offsets[0] if self.offsets else 0)),
+            (277, 3, 1, 1),
+            (278, 4, 1, self.rows_per_strip or self.height),
+            (279, 4, len(self.counts), arrays.get(279, self.counts[0] if self.counts else 0)),
+        ]
+        directory = self.file.tell()
+        self.file.write(struct.pack('<H', len(entries)))
+        for tag, kind, count, value in entries:
+            packed = struct.pack('<H', value) + b'\x00\x00' if kind == 3 and count == 1 else struct.pack('<I', value)
+            self.file.write(struct.pack('<HHI', tag, kind, count) + packed)
+        self.file.write(struct.pack('<I', 0))
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', directory))
+        self.file.close()
+
+def stream_dotted_image(output, width, height, dot_radius, dot_spacing, dot_pattern, density=30, seed=None,
+                        supersample=1, strip_height=512, bits=8, wrap=False):
+    """Render a dot pattern in horizontal strips straight into a PNG or TIFF file.
+
+    Only a few strips of samples and one strip of pixels are held at a time, so
+    peak memory does not grow with the canvas. Poisson samples are generated
+    per strip, keeping their distance from the samples of neighbouring strips
+    that already exist, so the minimum distance also holds across the seams.
+    With wrap the samples wrap around toroidally and the image tiles seamlessly.
+    """
+    strip_height = max(strip_height, 2 * dot_spacing)
+    strips = math.ceil(height / strip_height)
+    if output.lower().endswith(('.tif', '.tiff')):
+        writer = TiffStripWriter(output, width, height, bits)
+    else:
+        writer = PngStripWriter(output, width, height, bits)
+    reach = dot_radius + 2
+    rng = np.random.default_rng(seed)
+    samples = {}
+
+    def neighbours(k):
+        # (strip, vertical shift) pairs of the strips bordering strip k
+        pairs = []
+        if k > 0:
+            pairs.append((k - 1, 0))
+        if k < strips - 1:
+            pairs.append((k + 1, 0))
+        if wrap and strips > 1:
+            if k == 0:
+                pairs.append((strips - 1, -height))
+            if k == strips - 1:
+                pairs.append((0, height))
+        return pairs
+
+    def generate(k):
+        top, bottom = k * strip_height, min(height, (k + 1) * strip_height)
+        fixed = [np.empty((0, 2))]
+        for other, shift in neighbours(k):
+            if other in samples:
+                points = samples[other] + (0, shift)
+                fixed.append(points[(points[:, 1] >= top - dot_spacing) & (points[:, 1] < bottom + dot_spacing)])
+        fixed = np.concatenate(fixed) - (0, top)
+        points = generate_poisson_disc_samples(width, bottom - top, dot_spacing, density, rng, fixed=fixed,
+                                               wrap_x=wrap, wrap_y=wrap and strips == 1)
+        samples[k] = points + (0, top)
+
+    random_pattern = dot_pattern.lower() in ('random', 'r')
+    if not random_pattern and dot_pattern.lower() not in ('grid', 'g'):
+        raise Exception("Error: invalid dot pattern. Use 'grid' or 'random'.")
+    try:
+        for k in range(strips):
+            top, bottom = k * strip_height, min(height, (k + 1) * strip_height)
+            if random_pattern:
+                # The last strip is generated right after the first when wrapping,
+                # so the first strip can draw the dots that wrap over its top edge
+                for needed in [k, k + 1] + ([strips - 1] if wrap and k == 0 else []):
+                    if needed < strips and needed not in samples:
+                        generate(needed)
+                centers = [samples[k]] + [samples[other] + (0, shift) for other, shift in neighbours(k)]
+                centers = np.concatenate(centers)
+                centers = centers[(centers[:, 1] > top - reach) & (centers[:, 1] < bottom + reach)]
+                if wrap:
+                    centers = wrapped_centers(centers, width, height, reach, wrap_y=False)
+                coverage = rasterize_dots(width, bottom - top, centers, dot_radius, supersample, top)
+                # Drop samples no later strip needs
+                for old in [j for j in samples if j < k - 1 and not (wrap and j in (0, strips - 1))]:
+                    del samples[old]
             else:
-                found_valid_sample = True
-                active_samples.append(new_sample)
-                samples.append(new_sample)
-                grid[cell_y][cell_x] = new_sample
-                break
+                coverage = rasterize_grid(width, bottom - top, dot_radius, dot_spacing, supersample, top, height)
+            writer.write(coverage_to_pixels(coverage))
+    finally:
+        writer.close()
+    return output
+
+def dotted_image_filename(width, height, dot_radius, dot_spacing, dot_pattern, seed=None):
+    name = f"dotted_image_{width}x{height}_{dot_radius}_{dot_spacing}_{dot_pattern}"
+    if seed is not None:
+        name += f"_{seed}"
+    return name + ".png"
 
-        if not found_valid_sample:
-            active_samples.remove(sample)
+def render_dotted_image(width, height, dot_radius, dot_spacing, dot_pattern, density=30, seed=None,
+                        backend='numpy', supersample=1, wrap=False):
+    if dot_pattern.lower() in ('grid', 'g'):
+        centers = None
+    elif dot_pattern.lower() in ('random', 'r'):
+        centers = generate_poisson_disc_samples(width, height, dot_spacing, density, seed, wrap_x=wrap, wrap_y=wrap)
+        if wrap:
+            centers = wrapped_centers(centers, width, height, dot_radius + 2)
+    else:
+        raise Exception("Error: invalid dot pattern. Use 'grid' or 'random'.")
 
-    return samples
+    if backend == 'numpy':
+        if centers is None:
+            coverage = rasterize_grid(width, height, dot_radius, dot_spacing, supersample)
+        else:
+            coverage = rasterize_dots(width, height, centers, dot_radius, supersample)
+        return coverage_to_image(coverage)
 
-def create_dotted_image(width, height, dot_radius, dot_spacing, dot_pattern):
     image = Image.new('RGB', (width, height), (255, 255, 255))
     draw = ImageDraw.Draw(image)
-    if dot_pattern.lower() in ('grid', 'g'):
+    if centers is None:
         for i in range(int(dot_spacing/2), width, dot_spacing):
             for j in range(int(dot_spacing/2), height, dot_spacing):
                 draw.ellipse((i - dot_radius, j - dot_radius, i + dot_radius, j + dot_radius), fill=(0, 0, 0))
-    elif dot_pattern.lower() in ('random', 'r'):
-        density = int(input("Enter dot density: "))
-        for sample in generate_poisson_disc_samples(width, height, dot_spacing, density):
-            x = sample[0]
-            y = sample[1]
-            draw.ellipse((x - dot_radius, y - dot_radius, x + dot_radius, y + dot_radius), fill=(0, 0, 0))
     else:
-        print("Invalid dot pattern. Use 'grid' or 'hex'.")
-        sys.exit(1)
+        for x, y in centers:
+            draw.ellipse((x - dot_radius, y - dot_radius, x + dot_radius, y + dot_radius), fill=(0, 0, 0))
+    return image
+
+def create_dotted_image(width, height, dot_radius, dot_spacing, dot_pattern, density=30, seed=None,
+                        backend='numpy', supersample=1, output=None, show=True, wrap=False):
+    params = {"width": width, "height": height, "radius": dot_radius, "spacing": dot_spacing,
+              "pattern": dot_pattern, "density": density, "seed": seed, "supersample": supersample, "wrap": wrap}
+    image = render_dotted_image(width, height, dot_radius, dot_spacing, dot_pattern, density, seed, backend,
+                                supersample, wrap)
     #image = image.resize((width, width), resample=Image.LANCZOS)
-    image.show()
-    image.save(f"dotted_image_{width}x{height}_{dot_radius}_{dot_spacing}_{dot_pattern}.png", 'PNG')
-    
-if __name__ == "__main__":
+    if show:
+        image.show()
+    # The parameters go into a PNG text chunk so batch runs can tell whether an
+    # existing file is up to date without re-rendering it
+    output = output or dotted_image_filename(width, height, dot_radius, dot_spacing, dot_pattern, seed)
+    info = PngImagePlugin.PngInfo()
+    info.add_text(PARAMS_KEY, json.dumps(params, sort_keys=True))
+    image.save(output, 'PNG', pnginfo=info)
+    return output
+
+def output_is_current(output, params):
+    """True if output exists and was rendered with exactly these parameters."""
+    if not os.path.exists(output):
+        return False
+    try:
+        with Image.open(output) as image:
+            stored = image.text.get(PARAMS_KEY)
+    except (OSError, SyntaxError):
+        return False
+    return stored == json.dumps(params, sort_keys=True)
+
+def load_manifest(path):
+    """Read batch entries from a JSON list or a CSV file with a header row.
+
+    Columns: width, height, radius, spacing, pattern and optionally seed,
+    density, supersample, wrap and output.
+    """
+    with open(path, newline='') as f:
+        if path.lower().endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = [row for row in csv.DictReader(f)]
+
+    entries = []
+    for row in rows:
+        seed = row.get("seed")
+        entries.append({
+            "width": int(row["width"]),
+            "height": int(row["height"]),
+            "radius": int(row["radius"]),
+            "spacing": int(row["spacing"]),
+            "pattern": row["pattern"],
+            "density": int(row.get("density") or 30),
+            "seed": int(seed) if seed not in (None, "") else None,
+            "supersample": int(row.get("supersample") or 1),
+            "wrap": str(row.get("wrap") or "").lower() in ("1", "true", "yes", "y"),
+            "output": row.get("output") or None,
+        })
+    return entries
+
+def _render_entry(entry):
+    start = time.perf_counter()
+    create_dotted_image(entry["width"], entry["height"], entry["radius"], entry["spacing"], entry["pattern"],
+                        entry["density"], entry["seed"], supersample=entry["supersample"],
+                        output=entry["output"], show=False, wrap=entry["wrap"])
+    return entry["output"], time.perf_counter() - start
+
+def run_batch(entries, output_dir='.', workers=None, force=False):
+    """Render every manifest entry on a process pool, skipping up-to-date files."""
+    os.makedirs(output_dir, exist_ok=True)
+    todo = []
+    for entry in entries:
+        name = entry["output"] or dotted_image_filename(entry["width"], entry["height"], entry["radius"],
+                                                        entry["spacing"], entry["pattern"], entry["seed"])
+        entry = dict(entry, output=os.path.join(output_dir, name))
+        params = {k: v for k, v in entry.items() if k != "output"}
+        if not force and output_is_current(entry["output"], params):
+            print(f"Skipping {entry['output']} (up to date)")
+            continue
+        todo.append(entry)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render_entry, entry) for entry in todo]
+        for future in as_completed(futures):
+            output, elapsed = future.result()
+            print(f"Rendered {output} in {elapsed:.2f} s")
+    return len(todo)
+
+def resolve_preset(preset):
+    size_preset, _, aspect_preset = preset.lower().partition('_')
+    if size_preset not in size_preset_list or aspect_preset not in aspect_preset_list:
+        raise Exception(f"Error: invalid preset '{preset}'")
+    return (size_preset_list[size_preset][aspect_preset_list[aspect_preset][0]],
+            size_preset_list[size_preset][aspect_preset_list[aspect_preset][1]])
+
+def interactive():
     while(True):
         if(input("Use presets? (y/n): ").lower() in ('y', 'yes')):
             print("Presets:")
@@ -141,8 +680,65 @@ if __name__ == "__main__":
         dot_radius = int(input("Enter dot radius in px: "))
         dot_spacing = int(input("Enter dot spacing in px: "))
         dot_pattern = input("Enter dot pattern (grid or random): ")
-        
-        create_dotted_image(image_width, image_height, dot_radius, dot_spacing, dot_pattern)
+        density = 30
+        if dot_pattern.lower() in ('random', 'r'):
+            density = int(input("Enter dot density: "))
+
+        try:
+            create_dotted_image(image_width, image_height, dot_radius, dot_spacing, dot_pattern, density)
+        except Exception as e:
+            print(str(e))
         if(input("Generate another image? (y/n): ").lower() in ('n', 'no')):
             break;
 
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        interactive()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Generate black and white dot grid images")
+    parser.add_argument("--preset", help="size and aspect preset, e.g. hd_s or 4k_v")
+    parser.add_argument("--width", type=int, help="image width in px")
+    parser.add_argument("--height", type=int, help="image height in px")
+    parser.add_argument("--radius", type=int, default=2, help="dot radius in px (default: 2)")
+    parser.add_argument("--spacing", type=int, default=10, help="dot spacing in px (default: 10)")
+    parser.add_argument("--pattern", default="grid", help="grid or random (default: grid)")
+    parser.add_argument("--density", type=int, default=30, help="attempts per sample for random dots (default: 30)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible random dots")
+    parser.add_argument("--supersample", type=int, default=1, help="supersampling factor for anti-aliased dots (default: 1)")
+    parser.add_argument("-o", "--output", help="output file (default: dotted_image_<params>.png)")
+    parser.add_argument("--show", action="store_true", help="display the image after rendering")
+    parser.add_argument("--wrap", action="store_true", help="wrap random dots around the edges so the image tiles seamlessly")
+    parser.add_argument("--stream", action="store_true", help="render in strips straight into a PNG or TIFF file, for huge canvases")
+    parser.add_argument("--strip-height", type=int, default=512, help="rows per strip with --stream (default: 512)")
+    parser.add_argument("--bits", type=int, choices=(1, 8), default=8, help="bit depth of --stream output (default: 8)")
+    parser.add_argument("--manifest", help="JSON or CSV file of images to render in a batch")
+    parser.add_argument("--output-dir", default=".", help="directory for batch output (default: current directory)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for batches (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="re-render batch entries even if the output is up to date")
+    parser.add_argument("--benchmark", action="store_true", help="time Poisson disc sampling at the size presets")
+    args = parser.parse_args()
+
+    try:
+        if args.benchmark:
+            benchmark_poisson_disc_samples()
+        elif args.manifest:
+            run_batch(load_manifest(args.manifest), args.output_dir, args.workers, args.force)
+        else:
+            if args.preset:
+                width, height = resolve_preset(args.preset)
+            elif args.width and args.height:
+                width, height = args.width, args.height
+            else:
+                parser.error("give --preset or both --width and --height")
+            if args.stream:
+                output = args.output or dotted_image_filename(width, height, args.radius, args.spacing, args.pattern, args.seed)
+                stream_dotted_image(output, width, height, args.radius, args.spacing, args.pattern, args.density,
+                                    args.seed, args.supersample, args.strip_height, args.bits, args.wrap)
+            else:
+                output = create_dotted_image(width, height, args.radius, args.spacing, args.pattern, args.density,
+                                             args.seed, supersample=args.supersample, output=args.output,
+                                             show=args.show, wrap=args.wrap)
+            print(f"Saved {output}")
+    except Exception as e:
+        print(str(e))
@@ -1,32 +1,29 @@
 import argparse
 import cv2
-import numpy as np
 import os
 
-def main(input_image, output_dir, output_size):
-    # Load the input image
-    img = cv2.imread(input_image)
+from segmentation import cut_out, load_image, segment
 
-    # Get the list of contours from the input image
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    #_, contours, _ = cv2.findContours(gray, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    contours, _ = cv2.findContours(gray, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Iterate over each contour
-    for i, contour in enumerate(contours):
-        # Get the bounding box of the contour
-        x, y, w, h = cv2.boundingRect(contour)
+def main(input_image, output_dir, output_size, min_area=16, keep_nested=False):
+    # Load the input image, alpha included
+    img = load_image(input_image)
 
-        # Crop the object from the image
-        object_img = img[y:y+h, x:x+w]
+    # Find the objects as connected components of the alpha or thresholded image;
+    # specks and parts nested inside another object are not objects of their own
+    labels, objects = segment(img, min_area, keep_nested)
+    if len(objects) == 0:
+        raise Exception("Error: no objects found in the input image")
 
-        # Resize the object to a square shape
-        size = max(object_img.shape[0], object_img.shape[1])
-        object_img = cv2.resize(object_img, (size, size))
-        object_img = cv2.resize(object_img, (output_size, output_size))
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Iterate over each object
+    for i, obj in enumerate(objects):
+        # Cut the object out of the image and scale it once into a square,
+        # keeping its aspect; PNG keeps the transparency around it
+        object_img = cut_out(img, labels, obj, output_size)
 
         # Save the object image
-        output_path = os.path.join(output_dir, 'object_{}.jpg'.format(i))
+        output_path = os.path.join(output_dir, 'object_{}.png'.format(i))
         cv2.imwrite(output_path, object_img)
 
 if __name__ == '__main__':
@@ -35,7 +32,12 @@ if __name__ == '__main__':
     parser.add_argument('input_image', type=str, help='Path to the input image')
     parser.add_argument('output_dir', type=str, help='Path to the output directory')
     parser.add_argument('output_size', type=int, help='Size of the output square images')
+    parser.add_argument('--min-area', type=int, default=16, help='Ignore specks with fewer pixels than this')
+    parser.add_argument('--keep-nested', action='store_true', help='Save parts nested inside another object as objects too')
     args = parser.parse_args()
 
     # Call the main function
-    main(args.input_image, args.output_dir, args.output_size)
+    try:
+        main(args.input_image, args.output_dir, args.output_size, args.min_area, args.keep_nested)
+    except Exception as e:
+        print(f"Error: {str(e)}")
@@ -1,22 +1,20 @@
-import os
-from PIL import ImageTk, Image
+from PIL import ImageTk
+import argparse
 import tkinter as tk
 
+from image_discovery import find_images
+from thumbnail_cache import ThumbnailCache, DEFAULT_CACHE, GALLERY_SIZE
+
 # Function to search for image files in a directory and its subdirectories
 def search_images(directory):
-    image_files = []
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if os.path.isdir(filepath):
-            image_files += search_images(filepath)
-        elif filename.endswith('.jpg') or filename.endswith('.jpeg') or filename.endswith('.png'):
-            image_files.append(filepath)
-    return image_files
+    return find_images(directory, extensions=('.jpg', '.jpeg', '.png'))
 
 # Function to display an image in a slideshow window
 def show_image(filepath, root):
     root.title(filepath)
-    img = Image.open(filepath)
+    # thumbnails come from the on-disk cache after the first visit, or a warm-up
+    # with thumbnail_cache.py at the same size
+    img = thumbnail_cache.thumbnail(filepath, thumbnail_size)
     photo = ImageTk.PhotoImage(img)
     label = tk.Label(root, image=photo)
     label.pack()
@@ -55,8 +53,15 @@ def show_image(filepath, root):
 
     root.mainloop()
 
+parser = argparse.ArgumentParser(description="Show the images under the current directory in a slideshow")
+parser.add_argument("--size", type=int, nargs=2, default=GALLERY_SIZE, metavar=("W", "H"), help="thumbnail box (default: 800 600, as thumbnail_cache.py warms)")
+parser.add_argument("--cache", default=DEFAULT_CACHE, help="thumbnail cache file, fill it ahead with thumbnail_cache.py")
+args = parser.parse_args()
+thumbnail_size = tuple(args.size)
+
 # Get a list of image files and display them in a slideshow
 image_files = search_images('.')
+thumbnail_cache = ThumbnailCache(args.cache)
 root = tk.Tk()
 for filepath in image_files:
     show_image(filepath, root)
@@ -0,0 +1,111 @@
+"""
+Find the objects on a sprite sheet or scan and cut them out with transparency,
+shared by extract_icons.py and obj_detect.py.
+
+The foreground mask comes from the image's alpha channel when it has one, or
+else from an Otsu threshold of its brightness (inverted when the background
+turns out to be the bright side). Objects are the 8-connected components of
+that mask, found in one pass by cv2.connectedComponentsWithStats; specks below
+a minimum area are dropped, and components lying inside another one's box (the
+pupil of an eye, the dot of an i) are folded into it instead of becoming
+objects of their own. Each cutout gets its alpha straight from the component
+labels and is scaled once, keeping its aspect, into a square.
+"""
+
+import cv2
+import numpy as np
+
+# load an image as 8-bit BGR or BGRA, keeping the alpha channel cv2.imread drops by default
+def load_image(path):
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise Exception("Error: input image not found")
+    if image.dtype == np.uint16:
+        image = (image >> 8).astype(np.uint8)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image
+
+def has_alpha(image):
+    return image.ndim == 3 and image.shape[2] == 4 and bool((image[:, :, 3] < 255).any())
+
+# 255 where the image has foreground, 0 elsewhere
+def foreground_mask(image, alpha_threshold=0):
+    if has_alpha(image):
+        return np.where(image[:, :, 3] > alpha_threshold, 255, 0).astype(np.uint8)
+    gray = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2GRAY)
+    mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+    # the background is whichever side most of the border is on
+    border = np.concatenate((mask[0], mask[-1], mask[:, 0], mask[:, -1]))
+    if border.mean() > 127:
+        mask = 255 - mask
+    return mask
+
+def find_objects(mask, min_area=16, keep_nested=False):
+    """The objects of a mask as (labels, [(x, y, w, h, component labels)]):
+    labels is the component image and each object lists the labels that make it
+    up, its own plus those of the components nested in its box."""
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    # label 0 is the background
+    ids = np.arange(1, count)
+    ids = ids[stats[ids, cv2.CC_STAT_AREA] >= min_area]
+    boxes = stats[ids, :4].astype(np.int64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+
+    parent = np.full(len(ids), -1)
+    if not keep_nested and len(ids) > 1:
+        areas = stats[ids, cv2.CC_STAT_AREA]
+        box_areas = boxes[:, 2] * boxes[:, 3]
+        # a block of rows at a time, so thousands of objects need no huge matrix
+        for start in range(0, len(ids), 1024):
+            rows = slice(start, start + 1024)
+            # inside[i, j]: box i lies within box j; ties go to the larger component
+            inside = ((x0[rows, None] >= x0[None, :]) & (y0[rows, None] >= y0[None, :]) &
+                      (x1[rows, None] <= x1[None, :]) & (y1[rows, None] <= y1[None, :]))
+            inside &= (areas[rows, None] < areas[None, :]) | ((areas[rows, None] == areas[None, :]) & (ids[rows, None] > ids[None, :]))
+            # fold each nested component into the largest box around it
+            enclosing = np.where(inside, box_areas[None, :], -1)
+            parent[rows] = np.where(inside.any(axis=1), enclosing.argmax(axis=1), -1)
+        # follow chains of nesting up to a top-level object
+        while True:
+            grand = np.where(parent >= 0, parent[parent], -1)
+            grand = np.where(grand >= 0, grand, parent)
+            if (grand == parent).all():
+                break
+            parent = grand
+
+    objects = []
+    for i in np.flatnonzero(parent < 0):
+        members = [int(ids[i])] + [int(ids[j]) for j in np.flatnonzero(parent == i)]
+        x, y, w, h = (int(v) for v in boxes[i])
+        objects.append((x, y, w, h, members))
+    # reading order, top to bottom then left to right
+    objects.sort(key=lambda o: (o[1], o[0]))
+    return labels, objects
+
+def segment(image, min_area=16, keep_nested=False, alpha_threshold=0):
+    """Find the objects of an image loaded with load_image, as for find_objects."""
+    return find_objects(foreground_mask(image, alpha_threshold), min_area, keep_nested)
+
+def cut_out(image, labels, obj, size, padding=0):
+    """The object cut out as a BGRA square of size x size: transparent outside
+    the object, scaled once to fit inside padding, keeping its aspect."""
+    x, y, w, h, members = obj
+    crop = image[y:y + h, x:x + w]
+    inside = np.isin(labels[y:y + h, x:x + w], members)
+    if crop.shape[2] == 4:
+        alpha = np.where(inside, crop[:, :, 3], 0).astype(np.uint8)
+    else:
+        alpha = inside.astype(np.uint8) * 255
+    icon = np.dstack((crop[:, :, :3], alpha))
+
+    inner = max(1, size - 2 * padding)
+    scale = inner / max(w, h)
+    fit = (max(1, round(w * scale)), max(1, round(h * scale)))
+    if fit != (w, h):
+        icon = cv2.resize(icon, fit, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    square = np.zeros((size, size, 4), np.uint8)
+    left, top = (size - fit[0]) // 2, (size - fit[1]) // 2
+    square[top:top + fit[1], left:left + fit[0]] = icon
+    return square
@@ -0,0 +1,188 @@
+"""
+Pack many small images into a few power-of-two texture atlases.
+
+Loading thousands of tiny PNGs costs a file open and a PNG header per icon;
+an atlas packs them into one or more larger sheets, and a JSON sidecar gives
+every sprite's sheet, pixel rectangle and UV coordinates, so a game loads a
+single texture and slices it.
+
+Sprites are placed with the MaxRects algorithm (best short side fit): the free
+space of a sheet is kept as a list of maximal free rectangles, each sprite goes
+where it leaves the smallest leftover on its shorter side, and the rectangles it
+overlaps are split around it. Each sheet is the smallest power-of-two size,
+up to max_size, that still fits what is left to pack.
+
+UVs have their origin at the top left, matching the pixel rectangles; flip v
+for loaders that expect it at the bottom.
+
+Usage:
+    python texture_atlas.py icons/ atlas --max-size 2048 --spacing 1
+"""
+
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from image_discovery import find_images
+
+class MaxRectsBin:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.free = [(0, 0, width, height)]
+
+    def insert(self, w, h):
+        """Place a w x h rectangle, returning its (x, y), or None if it does not fit."""
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh:
+                score = (min(fw - w, fh - h), max(fw - w, fh - h))
+                if best is None or score < best[0]:
+                    best = (score, fx, fy)
+        if best is None:
+            return None
+        _, x, y = best
+        self._split(x, y, w, h)
+        return x, y
+
+    # carve the placed rectangle out of every free rectangle it overlaps
+    def _split(self, x, y, w, h):
+        kept, split = [], set()
+        for fx, fy, fw, fh in self.free:
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append((fx, fy, fw, fh))
+                continue
+            if x > fx:
+                split.add((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                split.add((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                split.add((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                split.add((fx, y + h, fw, fy + fh - y - h))
+        # drop rectangles contained in another one; the kept ones were already
+        # maximal among themselves, so only pairs involving a new one are checked
+        split = [r for r in split if not any(_contains(o, r) for o in kept)
+                 and not any(o != r and _contains(o, r) for o in split)]
+        self.free = [r for r in kept if not any(_contains(o, r) for o in split)] + split
+
+# whether rectangle outer contains rectangle inner
+def _contains(outer, inner):
+    return (inner[0] >= outer[0] and inner[1] >= outer[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+# power-of-two sheet sizes up to max_size, smallest area first
+def sheet_sizes(max_size):
+    sizes = []
+    side = 1
+    while side <= max_size:
+        sizes.append((side, side))
+        if side * 2 <= max_size:
+            sizes.append((side * 2, side))
+        side *= 2
+    return sizes
+
+# try to place every size in a width x height sheet; returns the placements
+# {index: (x, y)} of those that fit
+def _fill(sizes, order, width, height, spacing):
+    sheet = MaxRectsBin(width, height)
+    placed = {}
+    for i in order:
+        w, h = sizes[i]
+        position = sheet.insert(w + spacing, h + spacing)
+        if position is not None:
+            placed[i] = position
+    return placed
+
+def pack(sizes, max_size=4096, spacing=1):
+    """Pack (width, height) sizes into power-of-two sheets no larger than
+    max_size, with spacing pixels between sprites. Returns a list of sheets,
+    each ((width, height), {index: (x, y)})."""
+    if max_size < 1 or max_size & (max_size - 1):
+        raise Exception(f"Error: max size {max_size} is not a power of two")
+    for w, h in sizes:
+        if w + spacing > max_size or h + spacing > max_size:
+            raise Exception(f"Error: a {w}x{h} sprite does not fit in a {max_size}x{max_size} sheet")
+    remaining = list(range(len(sizes)))
+    sheets = []
+    while remaining:
+        # largest first packs tightest
+        order = sorted(remaining, key=lambda i: (max(sizes[i]), sizes[i][0] * sizes[i][1]), reverse=True)
+        area = sum((sizes[i][0] + spacing) * (sizes[i][1] + spacing) for i in remaining)
+        for width, height in sheet_sizes(max_size):
+            if width * height < area and (width, height) != (max_size, max_size):
+                continue
+            placed = _fill(sizes, order, width, height, spacing)
+            # a full-size sheet takes whatever fits, smaller ones must fit everything
+            if len(placed) == len(remaining) or (width, height) == (max_size, max_size):
+                break
+        sheets.append(((width, height), placed))
+        remaining = [i for i in remaining if i not in placed]
+    return sheets
+
+def build_atlas(sprites, output_prefix, max_size=4096, spacing=1):
+    """Pack (name, image) pairs into output_prefix_0.png, output_prefix_1.png, ...
+    and write their rectangles and UVs to output_prefix.json. Images are numpy
+    arrays as cv2 loads them; sheets get an alpha channel if any sprite has one.
+    Returns the sidecar dict."""
+    if not sprites:
+        raise Exception("Error: nothing to pack")
+    channels = 4 if any(image.ndim == 3 and image.shape[2] == 4 for _, image in sprites) else 3
+    sheets = pack([(image.shape[1], image.shape[0]) for _, image in sprites], max_size, spacing)
+    output_dir = os.path.dirname(os.path.abspath(output_prefix))
+    os.makedirs(output_dir, exist_ok=True)
+
+    sidecar = {"sheets": [], "sprites": {}}
+    for n, ((width, height), placed) in enumerate(sheets):
+        sheet = np.zeros((height, width, channels), np.uint8)
+        for i, (x, y) in placed.items():
+            name, image = sprites[i]
+            h, w = image.shape[:2]
+            sheet[y:y + h, x:x + w] = _with_channels(image, channels)
+            sidecar["sprites"][name] = {"sheet": n, "x": x, "y": y, "w": w, "h": h,
+                                        "u0": x / width, "v0": y / height,
+                                        "u1": (x + w) / width, "v1": (y + h) / height}
+        sheet_path = f"{output_prefix}_{n}.png"
+        if not cv2.imwrite(sheet_path, sheet):
+            raise Exception(f"Error: could not write {sheet_path}")
+        sidecar["sheets"].append({"file": os.path.relpath(sheet_path, output_dir), "width": width, "height": height})
+
+    with open(f"{output_prefix}.json", "w") as f:
+        json.dump(sidecar, f, indent=1)
+    return sidecar
+
+# gray, BGR or BGRA image as BGR or BGRA
+def _with_channels(image, channels):
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == channels:
+        return image
+    if channels == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    return image[:, :, :3]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack a directory of images into power-of-two texture atlases")
+    parser.add_argument("input_dir", help="directory of images to pack")
+    parser.add_argument("output_prefix", help="atlas path without extension, e.g. out/atlas writes out/atlas_0.png and out/atlas.json")
+    parser.add_argument("--max-size", type=int, default=4096, help="largest sheet side, a power of two (default: 4096)")
+    parser.add_argument("--spacing", type=int, default=1, help="empty pixels between sprites (default: 1)")
+    args = parser.parse_args()
+
+    try:
+        sprites = []
+        for path in find_images(args.input_dir):
+            image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                print(f"Skipping {path}")
+                continue
+            name = os.path.splitext(os.path.relpath(path, args.input_dir))[0].replace(os.sep, "/")
+            sprites.append((name, image))
+        sidecar = build_atlas(sprites, args.output_prefix, args.max_size, args.spacing)
+        sizes = ", ".join(f"{s['width']}x{s['height']}" for s in sidecar["sheets"])
+        print(f"Packed {len(sidecar['sprites'])} sprites into {len(sidecar['sheets'])} sheets ({sizes})")
+    except Exception as e:
+        print(f"Error: {str(e)}")
@@ -0,0 +1,195 @@
+"""
+Persistent thumbnail cache for the gallery tools, packed into one SQLite file.
+
+Thumbnails are stored as small JPEG (or PNG, for images with transparency)
+blobs under a key hashed from the file's absolute path, mtime, size and the
+thumbnail size, so an edited or replaced file simply misses the cache and stale
+entries can be pruned later. A gallery reopening the same library reads only
+the small blobs instead of decoding every original again.
+
+Warming the cache for a whole tree decodes on a process pool, while the main
+process does all the SQLite writes. A warm-up only helps a viewer that asks for
+the same box, so the boxes the viewers use are defined here:
+
+    GALLERY_SIZE   800x600, codex_img_gallery.py and recursive_image_gallery.py
+                   (the warm-up default)
+    SHEET_SIZE     150x150, contact_sheet.py and the --grid mode of the sorters
+
+Usage:
+    python thumbnail_cache.py photos/ --workers 8
+    python thumbnail_cache.py photos/ --size 150 150
+    python thumbnail_cache.py --prune
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from image_discovery import find_images
+from image_preview import open_preview
+
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "utilitybelt", "thumbnails.db")
+
+# thumbnail boxes of the slideshow galleries and of contact sheet grids
+GALLERY_SIZE = (800, 600)
+SHEET_SIZE = (150, 150)
+
+# cache key of a file's thumbnail at a (width, height) box
+def thumbnail_key(path, size, st=None):
+    st = st or os.stat(path)
+    ident = f"{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{size[0]}x{size[1]}"
+    return hashlib.sha1(ident.encode("utf-8", "surrogateescape")).hexdigest()
+
+# decode a file at thumbnail size and encode it for storage
+def encode_thumbnail(path, size):
+    image = open_preview(path, size)
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(buffer, "PNG", optimize=False)
+    else:
+        image.convert("RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+class ThumbnailCache:
+    def __init__(self, path=DEFAULT_CACHE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        # readers keep working while a warm-up is writing
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS thumbnails (
+            key TEXT PRIMARY KEY, path TEXT, width INTEGER, height INTEGER, data BLOB)""")
+
+    def get(self, path, size):
+        """Returns the cached thumbnail of path as a PIL image, or None."""
+        row = self.db.execute("SELECT data FROM thumbnails WHERE key = ?", (thumbnail_key(path, size),)).fetchone()
+        if row is None:
+            return None
+        image = Image.open(io.BytesIO(row[0]))
+        image.load()
+        return image
+
+    def put(self, path, size, data, key=None):
+        self.db.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?)",
+                        (key or thumbnail_key(path, size), os.path.abspath(path), size[0], size[1], data))
+
+    def commit(self):
+        self.db.commit()
+
+    def thumbnail(self, path, size):
+        """The thumbnail of path fitting size, from the cache or decoded and stored."""
+        image = self.get(path, size)
+        if image is None:
+            data = encode_thumbnail(path, size)
+            self.put(path, size, data)
+            self.commit()
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        return image
+
+    def missing(self, paths, size):
+        """The paths with no up-to-date thumbnail at size, as (path, key) pairs."""
+        todo = []
+        for path in paths:
+            try:
+                key = thumbnail_key(path, size)
+            except OSError:
+                continue
+            if self.db.execute("SELECT 1 FROM thumbnails WHERE key = ?", (key,)).fetchone() is None:
+                todo.append((path, key))
+        return todo
+
+    def prune(self):
+        """Drop thumbnails of files that were deleted or changed. Returns how many."""
+        stale = []
+        for key, path, width, height in self.db.execute("SELECT key, path, width, height FROM thumbnails"):
+            try:
+                current = thumbnail_key(path, (width, height))
+            except OSError:
+                current = None
+            if current != key:
+                stale.append((key,))
+        self.db.executemany("DELETE FROM thumbnails WHERE key = ?", stale)
+        self.commit()
+        return len(stale)
+
+    def stats(self):
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails").fetchone()
+        return count, total
+
+    def close(self):
+        self.db.close()
+
+# worker: encode one thumbnail, returning (data, None), or (None, the error)
+# for a file that cannot be decoded, so one bad file does not stop the warm-up
+def _encode(path, size):
+    try:
+        return encode_thumbnail(path, size), None
+    except Exception as e:
+        return None, str(e)
+
+# fill the cache for every image under directory on a process pool
+def warm_cache(directory, size, cache_path=DEFAULT_CACHE, workers=None, max_in_flight=None):
+    cache = ThumbnailCache(cache_path)
+    try:
+        paths = find_images(directory)
+        todo = cache.missing(paths, size)
+        print(f"{len(paths)} images, {len(paths) - len(todo)} already cached")
+        workers = workers or os.cpu_count()
+        max_in_flight = max_in_flight or workers * 4
+        start = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # a bounded window of jobs keeps finished thumbnails from piling up
+            # in memory behind a slow one
+            pending = deque()
+            next_job = 0
+            while next_job < len(todo) or pending:
+                while next_job < len(todo) and len(pending) < max_in_flight:
+                    path, key = todo[next_job]
+                    pending.append((path, key, pool.submit(_encode, path, size)))
+                    next_job += 1
+                path, key, future = pending.popleft()
+                data, error = future.result()
+                if data is None:
+                    failed += 1
+                    print(f"Skipping {path}: {error}")
+                    continue
+                cache.put(path, size, data, key)
+                done += 1
+                if done % 100 == 0:
+                    cache.commit()
+                    print(f"{done}/{len(todo)} thumbnails", end="\r")
+        cache.commit()
+        seconds = time.perf_counter() - start
+        print(f"Cached {done} thumbnails in {seconds:.1f} s ({done / max(seconds, 1e-9):.1f}/s), {failed} failed")
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill or maintain the gallery thumbnail cache")
+    parser.add_argument("directory", nargs="?", help="warm the cache for every image under this directory")
+    parser.add_argument("--size", type=int, nargs=2, default=GALLERY_SIZE, metavar=("W", "H"),
+                        help="thumbnail box, must match the viewer's: 800 600 for the galleries (the default), 150 150 for contact sheets")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help=f"cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument("--workers", type=int, default=None, help="decoding processes (default: all cores)")
+    parser.add_argument("--prune", action="store_true", help="drop thumbnails of deleted or changed files")
+    args = parser.parse_args()
+
+    try:
+        if args.directory:
+            warm_cache(args.directory, tuple(args.size), args.cache, args.workers)
+        cache = ThumbnailCache(args.cache)
+        if args.prune:
+            print(f"Pruned {cache.prune()} stale thumbnails")
+        count, total = cache.stats()
+        print(f"{args.cache}: {count} thumbnails, {total / 1e6:.1f} MB")
+        cache.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")